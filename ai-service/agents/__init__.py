@@ -12,6 +12,7 @@ from .agent_definitions import (
     root_agent,
     revalidation_agent,  # Pipeline sin triage para revalidaciones
     AGENTS_BY_NAME,
+    AGENT_TOOL_NAMES,
     get_recommended_model,
     # Aliases para compatibilidad
     ingestion_agent,
@@ -48,6 +49,7 @@ __all__ = [
     "root_agent",
     "revalidation_agent",
     "AGENTS_BY_NAME",
+    "AGENT_TOOL_NAMES",
     "get_recommended_model",
     # Compatibility aliases
     "ingestion_agent",
@@ -216,6 +216,12 @@ AGENTS_BY_NAME = {
     "panic_investigator": investigator_agent,
 }
 
+# Nombres de tools por agente (estáticos durante la vida del proceso)
+AGENT_TOOL_NAMES = {
+    name: [t.__name__ for t in (getattr(agent, "tools", None) or [])]
+    for name, agent in AGENTS_BY_NAME.items()
+}
+
 
 # ============================================================================
 # LEGACY EXPORTS (Compatibilidad)
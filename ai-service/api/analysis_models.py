@@ -55,7 +55,7 @@ class AnalysisRequest(BaseModel):
 
     parameters: Dict[str, Any] = Field(
         default_factory=dict,
-        description="Parámetros específicos del análisis (vehicle_ids, driver_ids, days_back, etc.)"
+        description="Parámetros específicos del análisis (vehicle_ids, driver_ids, days_back, force_llm, etc.)"
     )
 
     raw_data: Dict[str, Any] = Field(
@@ -19,6 +19,14 @@ class LangfuseConfig:
     SECRET_KEY = os.getenv("LANGFUSE_SECRET_KEY", "")
     # Support both LANGFUSE_HOST and LANGFUSE_BASE_URL for compatibility
     HOST = os.getenv("LANGFUSE_HOST") or os.getenv("LANGFUSE_BASE_URL", "http://langfuse-web:3000")
+
+    # Forzar flush() síncrono al final de cada request. Por defecto el SDK
+    # envía en segundo plano (hilo propio) y solo se hace flush al apagar.
+    FLUSH_PER_REQUEST = os.getenv("LANGFUSE_FLUSH_PER_REQUEST", "false").lower() == "true"
+
+    # Fracción de análisis on-demand exitosos de riesgo bajo/medio que se
+    # trazan. Los errores y los riesgos high/critical se trazan siempre.
+    SAMPLE_RATE = float(os.getenv("LANGFUSE_SAMPLE_RATE", "0.1"))
     
     # Cliente singleton
     _client: Optional[Langfuse] = None
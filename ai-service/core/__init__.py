@@ -12,6 +12,8 @@ from .concurrency import (
 from .structured_logging import (
     setup_logging,
     get_logger,
+    get_trace_context,
+    set_trace_context,
     get_trace_id,
     set_trace_id,
     get_traceparent,
@@ -32,6 +34,8 @@ __all__ = [
     "ConcurrencyLimitExceeded",
     "setup_logging",
     "get_logger",
+    "get_trace_context",
+    "set_trace_context",
     "get_trace_id",
     "set_trace_id",
     "get_traceparent",
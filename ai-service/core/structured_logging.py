@@ -12,6 +12,7 @@ Standard fields:
 - trace_id: Unique request identifier for distributed tracing
 - message: Log message
 - context: Additional contextual data
+- Any keys passed via ``extra=`` are promoted to top-level fields
 
 Multi-tenant fields (when available):
 - event_id: ID del evento siendo procesado
@@ -29,30 +30,62 @@ from pathlib import Path
 from typing import Any, Optional
 
 # Context variables (thread-safe for async)
-trace_id_var: ContextVar[str] = ContextVar("trace_id", default="unknown")
-traceparent_var: ContextVar[str] = ContextVar("traceparent", default="unknown")
+# Trace fields live together in one immutable dict so a request needs a
+# single ContextVar.set() to propagate them.
+_DEFAULT_TRACE_CONTEXT: dict[str, Optional[str]] = {
+    "trace_id": "unknown",
+    "traceparent": "unknown",
+    "span_id": None,
+}
+trace_context_var: ContextVar[dict[str, Optional[str]]] = ContextVar(
+    "trace_context", default=_DEFAULT_TRACE_CONTEXT
+)
 event_id_var: ContextVar[Optional[int]] = ContextVar("event_id", default=None)
 company_id_var: ContextVar[Optional[int]] = ContextVar("company_id", default=None)
 
+# Attributes every LogRecord carries; anything else on a record came from
+# ``extra=`` and is promoted to a top-level JSON field by JsonFormatter.
+_RESERVED_RECORD_ATTRS = frozenset(
+    vars(logging.LogRecord("", logging.NOTSET, "", 0, "", (), None))
+) | {"message", "asctime", "context"}
+
+
+def get_trace_context() -> dict[str, Optional[str]]:
+    """Get the current trace context (trace_id, traceparent, span_id)."""
+    return trace_context_var.get()
+
+
+def set_trace_context(
+    trace_id: str,
+    traceparent: str,
+    span_id: Optional[str] = None,
+) -> None:
+    """Set all trace fields in context with a single ContextVar update."""
+    trace_context_var.set({
+        "trace_id": trace_id,
+        "traceparent": traceparent,
+        "span_id": span_id,
+    })
+
 
 def get_trace_id() -> str:
     """Get the current trace ID from context."""
-    return trace_id_var.get()
+    return trace_context_var.get()["trace_id"]
 
 
 def set_trace_id(trace_id: str) -> None:
     """Set the trace ID in context."""
-    trace_id_var.set(trace_id)
+    trace_context_var.set({**trace_context_var.get(), "trace_id": trace_id})
 
 
 def get_traceparent() -> str:
     """Get the current W3C traceparent from context."""
-    return traceparent_var.get()
+    return trace_context_var.get()["traceparent"]
 
 
 def set_traceparent(traceparent: str) -> None:
     """Set the W3C traceparent in context."""
-    traceparent_var.set(traceparent)
+    trace_context_var.set({**trace_context_var.get(), "traceparent": traceparent})
 
 
 def get_event_id() -> Optional[int]:
@@ -82,11 +115,10 @@ def set_request_context(
     traceparent: Optional[str] = None,
 ) -> None:
     """Set all request context variables at once."""
-    set_trace_id(trace_id)
+    current = trace_context_var.get()
+    set_trace_context(trace_id, traceparent or current["traceparent"], current["span_id"])
     set_event_id(event_id)
     set_company_id(company_id)
-    if traceparent:
-        set_traceparent(traceparent)
 
 
 class JsonFormatter(logging.Formatter):
@@ -103,13 +135,14 @@ class JsonFormatter(logging.Formatter):
     
     def format(self, record: logging.LogRecord) -> str:
         """Format log record as JSON."""
+        trace_context = trace_context_var.get()
         log_data: dict[str, Any] = {
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "level": record.levelname.lower(),
             "service": self.service,
             "environment": self.environment,
-            "traceparent": get_traceparent(),
-            "trace_id": get_trace_id(),
+            "traceparent": trace_context["traceparent"],
+            "trace_id": trace_context["trace_id"],
             "message": record.getMessage(),
         }
         
@@ -131,6 +164,11 @@ class JsonFormatter(logging.Formatter):
         if context:
             log_data["context"] = self._sanitize_context(context)
         
+        # Promote extra= fields to top level (never overriding standard fields)
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_RECORD_ATTRS and key not in log_data:
+                log_data[key] = self._sanitize_context(value)
+        
         # Add exception info if present
         if record.exc_info:
             log_data["exception"] = {
@@ -172,6 +210,7 @@ class ContextLogger(logging.LoggerAdapter):
     Usage:
         logger = get_logger(__name__)
         logger.info("Processing request", context={"user_id": 123})
+        logger.info("Request completed", extra={"status": 200})  # top-level fields
     """
     
     def process(self, msg: str, kwargs: dict) -> tuple[str, dict]:
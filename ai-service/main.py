@@ -3,16 +3,17 @@ Punto de entrada principal del servicio FastAPI.
 Inicializa la aplicación y registra las rutas.
 """
 
+import json
+import logging
 import os
 import time
-import uuid
 from contextlib import asynccontextmanager
 
 import sentry_sdk
 from fastapi import FastAPI, Request
 
-from config import ServiceConfig, SentryConfig
-from fastapi.responses import JSONResponse
+from config import ServiceConfig, SentryConfig, langfuse_client
+from fastapi.responses import Response
 
 from api import router, analytics_router, analysis_router
 
@@ -42,8 +43,7 @@ if SentryConfig.is_configured():
 from core.structured_logging import (
     setup_logging,
     get_logger,
-    set_trace_id,
-    set_traceparent,
+    set_trace_context,
     get_trace_id,
     get_traceparent,
     set_request_context,
@@ -78,6 +78,9 @@ async def lifespan(app: FastAPI):
     })
     yield
     logger.info("AI Service shutting down")
+    # Enviar los eventos de Langfuse que sigan en cola (no se hace flush por request)
+    if langfuse_client:
+        langfuse_client.flush()
 
 
 # ============================================================================
@@ -94,6 +97,14 @@ app = FastAPI(
 # ============================================================================
 # MIDDLEWARE: Trace ID and Request Logging
 # ============================================================================
+# Compact encoder built once for the error body (same output as JSONResponse)
+_ERROR_BODY_ENCODER = json.JSONEncoder(
+    ensure_ascii=False,
+    allow_nan=False,
+    separators=(",", ":"),
+)
+
+
 @app.middleware("http")
 async def trace_and_logging_middleware(request: Request, call_next):
     """
@@ -105,20 +116,25 @@ async def trace_and_logging_middleware(request: Request, call_next):
     # W3C traceparent with fallback to legacy X-Trace-ID
     traceparent = request.headers.get("traceparent")
     if traceparent and _is_valid_traceparent(traceparent):
-        trace_id = traceparent.split("-")[1]
+        trace_id = traceparent[3:35]
+        flags = traceparent[53:55]
         # Generate a new span-id for this service
-        span_id = uuid.uuid4().hex[:16]
-        flags = traceparent.split("-")[3]
+        span_id = os.urandom(8).hex()
         traceparent = f"00-{trace_id}-{span_id}-{flags}"
     else:
-        trace_id = uuid.uuid4().hex
-        span_id = uuid.uuid4().hex[:16]
+        trace_id = os.urandom(16).hex()
+        span_id = os.urandom(8).hex()
         traceparent = f"00-{trace_id}-{span_id}-01"
 
-    set_traceparent(traceparent)
-    set_trace_id(trace_id)
+    set_trace_context(trace_id, traceparent, span_id)
+
+    # Read request metadata straight from the ASGI scope instead of going
+    # through Starlette's URL/QueryParams/Address wrappers.
+    scope = request.scope
+    method = scope["method"]
+    path = scope["path"]
 
-    if request.url.path in ["/health", "/stats", "/up"]:
+    if path in ["/health", "/stats", "/up"]:
         response = await call_next(request)
         response.headers["traceparent"] = traceparent
         response.headers["X-Trace-ID"] = trace_id
@@ -126,34 +142,41 @@ async def trace_and_logging_middleware(request: Request, call_next):
     
     start_time = time.time()
     
-    # Log request start
-    logger.debug("Request started", context={
-        "method": request.method,
-        "path": request.url.path,
-        "query": str(request.query_params),
-        "client_ip": request.client.host if request.client else "unknown",
-    })
+    # Log request start (only build the fields when DEBUG is actually enabled)
+    if logger.isEnabledFor(logging.DEBUG):
+        query_string = scope.get("query_string")
+        client = scope.get("client")
+        logger.debug("Request started", extra={
+            "method": method,
+            "path": path,
+            "query": query_string.decode("latin-1") if query_string else "",
+            "client_ip": client[0] if client else "unknown",
+        })
     
     try:
         response = await call_next(request)
         
         duration_ms = round((time.time() - start_time) * 1000, 2)
         
-        # Determine log level based on status code
-        if response.status_code >= 500:
-            log_level = "error"
-        elif response.status_code >= 400:
-            log_level = "warning"
+        # Log request completion with a level based on status code
+        # (successful requests are skipped below INFO)
+        status = response.status_code
+        if status >= 500:
+            log = logger.error
+        elif status >= 400:
+            log = logger.warning
+        elif logger.isEnabledFor(logging.INFO):
+            log = logger.info
         else:
-            log_level = "info"
+            log = None
         
-        # Log request completion
-        getattr(logger, log_level)("Request completed", context={
-            "method": request.method,
-            "path": request.url.path,
-            "status": response.status_code,
-            "duration_ms": duration_ms,
-        })
+        if log is not None:
+            log("Request completed", extra={
+                "method": method,
+                "path": path,
+                "status": status,
+                "duration_ms": duration_ms,
+            })
         
         response.headers["traceparent"] = traceparent
         response.headers["X-Trace-ID"] = trace_id
@@ -163,21 +186,22 @@ async def trace_and_logging_middleware(request: Request, call_next):
     except Exception as e:
         duration_ms = round((time.time() - start_time) * 1000, 2)
         
-        logger.error("Request failed", context={
-            "method": request.method,
-            "path": request.url.path,
+        logger.error("Request failed", extra={
+            "method": method,
+            "path": path,
             "duration_ms": duration_ms,
             "error": str(e),
             "error_type": type(e).__name__,
         })
         
-        return JSONResponse(
-            status_code=500,
-            content={
+        return Response(
+            content=_ERROR_BODY_ENCODER.encode({
                 "error": "internal_server_error",
                 "message": str(e),
                 "trace_id": trace_id,
-            },
+            }).encode("utf-8"),
+            status_code=500,
+            media_type="application/json",
             headers={
                 "traceparent": traceparent,
                 "X-Trace-ID": trace_id,
@@ -185,10 +209,20 @@ async def trace_and_logging_middleware(request: Request, call_next):
         )
 
 
+_HEX_DIGITS = frozenset("0123456789abcdef")
+
+
 def _is_valid_traceparent(value: str) -> bool:
     """Validate W3C traceparent format: 00-{32hex}-{16hex}-{2hex}"""
-    import re
-    return bool(re.match(r"^00-[a-f0-9]{32}-[a-f0-9]{16}-[a-f0-9]{2}$", value))
+    return (
+        len(value) == 55
+        and value.startswith("00-")
+        and value[35] == "-"
+        and value[52] == "-"
+        and _HEX_DIGITS.issuperset(value[3:35])
+        and _HEX_DIGITS.issuperset(value[36:52])
+        and _HEX_DIGITS.issuperset(value[53:55])
+    )
 
 
 # ============================================================================
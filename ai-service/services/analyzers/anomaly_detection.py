@@ -5,8 +5,12 @@ desconexiones, horarios atípicos y conductas repetitivas.
 """
 
 import logging
-from collections import Counter, defaultdict
-from typing import Any, Dict, List, Tuple
+import re
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
 
 from api.analysis_models import RiskLevel, TrendDirection
 from .base import BaseAnalyzer
@@ -29,6 +33,19 @@ CONNECTIVITY_KEYWORDS = {
 }
 
 
+def _keyword_pattern(keywords: set) -> re.Pattern:
+    """Compila un set de keywords en una sola alternancia (match por substring)."""
+    return re.compile("|".join(re.escape(kw) for kw in sorted(keywords)))
+
+
+# Un regex por categoría: una búsqueda en C por evento en lugar de N `in`
+_CATEGORY_PATTERNS = (
+    _keyword_pattern(TAMPERING_KEYWORDS),
+    _keyword_pattern(CAMERA_OBSTRUCTION_KEYWORDS),
+    _keyword_pattern(CONNECTIVITY_KEYWORDS),
+)
+
+
 class AnomalyDetectionAnalyzer(BaseAnalyzer):
     """Detecta anomalías y patrones sospechosos en datos de flota."""
 
@@ -40,22 +57,23 @@ class AnomalyDetectionAnalyzer(BaseAnalyzer):
         safety_events = raw_data.get("safety_events", [])
         days_back = parameters.get("days_back", 7)
 
-        all_events = self._flatten_events(safety_events)
+        all_events = self.flatten_events(safety_events)
+
+        # Campos de cada evento extraídos una sola vez (listas paralelas a all_events)
+        table = self._build_event_table(all_events)
 
         # Clasificar eventos
-        tampering = self._filter_events(all_events, TAMPERING_KEYWORDS)
-        camera = self._filter_events(all_events, CAMERA_OBSTRUCTION_KEYWORDS)
-        connectivity = self._filter_events(all_events, CONNECTIVITY_KEYWORDS)
+        tampering, camera, connectivity = self._classify_events(all_events, table["types"])
         total_anomalies = len(tampering) + len(camera) + len(connectivity)
 
         # Análisis de repeat offenders
-        repeat_offenders = self._find_repeat_offenders(all_events)
+        repeat_offenders = self._find_repeat_offenders(table["offender_keys"])
 
         # Horas atípicas (fuera de 6:00-22:00)
-        off_hours = self._off_hours_events(all_events)
+        off_hours = self._off_hours_events(all_events, table["dts"])
 
         # Patrones de clustering (múltiples eventos del mismo vehículo en corto tiempo)
-        clusters = self._detect_event_clusters(all_events)
+        clusters = self._detect_event_clusters(table)
 
         # Métricas
         metrics = [
@@ -115,19 +133,40 @@ class AnomalyDetectionAnalyzer(BaseAnalyzer):
     # PRIVATE
     # =========================================================================
 
-    def _flatten_events(self, safety_events: Any) -> List[Dict]:
-        events = []
-        if isinstance(safety_events, dict):
-            data = safety_events.get("data", safety_events.get("events", []))
-            if isinstance(data, list):
-                events = data
-        elif isinstance(safety_events, list):
-            for item in safety_events:
-                if isinstance(item, dict) and "events" in item:
-                    events.extend(item["events"])
-                else:
-                    events.append(item)
-        return events
+    def _build_event_table(self, events: List[Dict]) -> Dict[str, List]:
+        """
+        Recorre los eventos una sola vez y devuelve listas paralelas con los
+        campos que usan los detectores (tipo, timestamp, vehículo, reincidente).
+        """
+        types: List[str] = []
+        dts: List[Optional[datetime]] = []
+        vehicle_ids: List[str] = []
+        asset_names: List[Optional[str]] = []
+        offender_keys: List[str] = []
+
+        for event in events:
+            asset = event.get("asset", {})
+            vehicle = event.get("vehicle", {})
+            driver = event.get("driver", {})
+            asset_name = asset.get("name")
+            driver_name = driver.get("name") if isinstance(driver, dict) else None
+            ts = event.get("createdAtTime") or event.get("timestamp") or event.get("time")
+
+            types.append(self._get_event_type_raw(event))
+            dts.append(self.parse_iso_timestamp(ts))
+            vehicle_ids.append(asset.get("id") or vehicle.get("id") or "unknown")
+            asset_names.append(asset_name)
+            offender_keys.append(
+                driver_name or asset_name or vehicle.get("name") or "Desconocido"
+            )
+
+        return {
+            "types": types,
+            "dts": dts,
+            "vehicle_ids": vehicle_ids,
+            "asset_names": asset_names,
+            "offender_keys": offender_keys,
+        }
 
     def _get_event_type_raw(self, event: Dict) -> str:
         """Obtiene el tipo de evento en formato raw (para matching de keywords)."""
@@ -140,81 +179,83 @@ class AnomalyDetectionAnalyzer(BaseAnalyzer):
             return (label.get("label") or label.get("name") or "").lower()
         return (event.get("type") or event.get("type_description") or "").lower()
 
-    def _filter_events(self, events: List[Dict], keywords: set) -> List[Dict]:
-        result = []
-        for event in events:
-            event_type = self._get_event_type_raw(event)
-            if any(kw in event_type for kw in keywords):
-                result.append(event)
-        return result
+    def _classify_events(
+        self, events: List[Dict], event_types: List[str],
+    ) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+        """
+        Clasifica eventos en tampering, cámara y conectividad en una sola pasada.
+        Un evento puede caer en más de una categoría.
+        """
+        tampering, camera, connectivity = [], [], []
+        buckets = tuple(zip(_CATEGORY_PATTERNS, (tampering, camera, connectivity)))
+        for event, event_type in zip(events, event_types):
+            if not event_type:
+                continue
+            for pattern, bucket in buckets:
+                if pattern.search(event_type):
+                    bucket.append(event)
+        return tampering, camera, connectivity
 
-    def _find_repeat_offenders(self, events: List[Dict]) -> List[Tuple[str, int]]:
+    def _find_repeat_offenders(self, offender_keys: List[str]) -> List[Tuple[str, int]]:
         """Encuentra vehículos/conductores con múltiples eventos."""
-        counter = Counter()
-        for event in events:
-            asset = event.get("asset", {})
-            name = asset.get("name") or event.get("vehicle", {}).get("name")
-            driver = event.get("driver", {})
-            driver_name = driver.get("name") if isinstance(driver, dict) else None
-
-            key = driver_name or name or "Desconocido"
-            counter[key] += 1
-
-        # Solo reincidentes (3+ eventos)
-        return [(name, count) for name, count in counter.most_common() if count >= 3]
+        counts: Dict[str, int] = {}
+        for key in offender_keys:
+            counts[key] = counts.get(key, 0) + 1
+
+        # Solo reincidentes (3+ eventos); se ordenan únicamente los que pasan el umbral
+        return sorted(
+            ((name, count) for name, count in counts.items() if count >= 3),
+            key=lambda item: item[1],
+            reverse=True,
+        )
 
-    def _off_hours_events(self, events: List[Dict]) -> List[Dict]:
+    def _off_hours_events(
+        self, events: List[Dict], dts: List[Optional[datetime]],
+    ) -> List[Dict]:
         """Eventos fuera de horario operativo (22:00 - 06:00)."""
-        result = []
-        for event in events:
-            ts = event.get("createdAtTime") or event.get("timestamp") or event.get("time")
-            hour = self.get_hour_from_timestamp(ts)
-            if hour is not None and (hour >= 22 or hour < 6):
-                result.append(event)
-        return result
+        return [
+            event for event, dt in zip(events, dts)
+            if dt is not None and (dt.hour >= 22 or dt.hour < 6)
+        ]
 
-    def _detect_event_clusters(self, events: List[Dict]) -> List[Dict]:
+    def _detect_event_clusters(self, table: Dict[str, List]) -> List[Dict]:
         """
         Detecta clusters: 3+ eventos del mismo vehículo en 30 minutos.
         """
-        # Agrupar por vehículo
-        by_vehicle: Dict[str, List] = defaultdict(list)
-        for event in events:
-            asset = event.get("asset", {})
-            vid = asset.get("id") or event.get("vehicle", {}).get("id") or "unknown"
-            ts = event.get("createdAtTime") or event.get("timestamp") or event.get("time")
-            dt = self.parse_iso_timestamp(ts)
+        # Agrupar por vehículo (índices dentro de la tabla de eventos)
+        by_vehicle: Dict[str, List[int]] = defaultdict(list)
+        dts = table["dts"]
+        for i, (vid, dt) in enumerate(zip(table["vehicle_ids"], dts)):
             if dt:
-                by_vehicle[vid].append({"event": event, "dt": dt})
+                by_vehicle[vid].append(i)
 
         clusters = []
-        for vid, vehicle_events in by_vehicle.items():
-            if len(vehicle_events) < 3:
+        for vid, indices in by_vehicle.items():
+            if len(indices) < 3:
                 continue
 
-            sorted_events = sorted(vehicle_events, key=lambda x: x["dt"])
-            # Ventana deslizante de 30 min
-            for i in range(len(sorted_events)):
-                cluster_events = [sorted_events[i]]
-                for j in range(i + 1, len(sorted_events)):
-                    diff = (sorted_events[j]["dt"] - sorted_events[i]["dt"]).total_seconds()
-                    if diff <= 1800:  # 30 minutos
-                        cluster_events.append(sorted_events[j])
-                    else:
-                        break
-
-                if len(cluster_events) >= 3:
-                    vehicle_name = (
-                        cluster_events[0]["event"].get("asset", {}).get("name")
-                        or vid
-                    )
-                    clusters.append({
-                        "vehicle_id": vid,
-                        "vehicle_name": vehicle_name,
-                        "event_count": len(cluster_events),
-                        "window_minutes": 30,
-                    })
-                    break  # Solo un cluster por vehículo
+            # Ventana deslizante de 30 min: para cada evento (ordenado por tiempo)
+            # cuántos eventos caen dentro de los siguientes 1800 segundos.
+            ts = np.fromiter(
+                (dts[i].timestamp() for i in indices),
+                dtype=np.float64,
+                count=len(indices),
+            )
+            order = np.argsort(ts, kind="stable")
+            ts = ts[order]
+            end_idx = np.searchsorted(ts, ts + 1800, side="right")
+            counts = end_idx - np.arange(len(ts))
+
+            starts = np.flatnonzero(counts >= 3)
+            if starts.size:
+                first = int(starts[0])  # Solo un cluster por vehículo
+                vehicle_name = table["asset_names"][indices[int(order[first])]] or vid
+                clusters.append({
+                    "vehicle_id": vid,
+                    "vehicle_name": vehicle_name,
+                    "event_count": int(counts[first]),
+                    "window_minutes": 30,
+                })
 
         return clusters
 
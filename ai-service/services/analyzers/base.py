@@ -3,7 +3,10 @@ Clase base para todos los analizadores de flota.
 Define la interfaz común y utilidades compartidas.
 """
 
+import time
 from abc import ABC, abstractmethod
+from functools import lru_cache
+from itertools import chain
 from typing import Any, Dict, List, Optional
 from datetime import datetime, timezone
 
@@ -14,6 +17,53 @@ from api.analysis_models import (
     TrendDirection,
 )
 
+# Texto en español para cada nivel de riesgo (resúmenes ejecutivos)
+RISK_LEVEL_TEXT: Dict[RiskLevel, str] = {
+    RiskLevel.LOW: "bajo",
+    RiskLevel.MEDIUM: "moderado",
+    RiskLevel.HIGH: "alto",
+    RiskLevel.CRITICAL: "critico",
+}
+
+# Orden de severidad de cada nivel de riesgo (para max()/comparaciones)
+RISK_LEVEL_RANK: Dict[RiskLevel, int] = {
+    RiskLevel.LOW: 0,
+    RiskLevel.MEDIUM: 1,
+    RiskLevel.HIGH: 2,
+    RiskLevel.CRITICAL: 3,
+}
+
+
+# Último "ahora" ISO calculado: [instante monotónico, isoformat]. Se reutiliza
+# durante 1 segundo; la ventana describe días, así que el desfase es irrelevante.
+_NOW_CACHE: List[Any] = [float("-inf"), ""]
+
+
+def _now_iso() -> str:
+    """Fecha/hora UTC actual en ISO, cacheada con granularidad de 1 segundo."""
+    t = time.monotonic()
+    if t - _NOW_CACHE[0] >= 1.0:
+        _NOW_CACHE[1] = datetime.now(timezone.utc).isoformat()
+        _NOW_CACHE[0] = t
+    return _NOW_CACHE[1]
+
+
+@lru_cache(maxsize=8192)
+def _parse_iso(ts: str) -> Optional[datetime]:
+    """Parseo ISO 8601 memoizado: los eventos suelen repetir timestamps."""
+    try:
+        # Desde Python 3.11 fromisoformat (en C) acepta el sufijo "Z" directamente
+        return datetime.fromisoformat(ts)
+    except (ValueError, TypeError):
+        return None
+
+
+@lru_cache(maxsize=8192)
+def _hour_of(ts: str) -> Optional[int]:
+    """Hora (0-23) memoizada de un timestamp ISO."""
+    dt = _parse_iso(ts)
+    return dt.hour if dt else None
+
 
 class BaseAnalyzer(ABC):
     """Clase base para analizadores deterministas de datos de flota."""
@@ -50,8 +100,12 @@ class BaseAnalyzer(ABC):
         trend_value: Optional[str] = None,
         severity: Optional[RiskLevel] = None,
     ) -> AnalysisMetric:
-        """Construye un AnalysisMetric de forma concisa."""
-        return AnalysisMetric(
+        """
+        Construye un AnalysisMetric de forma concisa.
+        Usa model_construct (sin validación): los valores los generan los
+        propios analizadores y ya tienen los tipos correctos.
+        """
+        return AnalysisMetric.model_construct(
             key=key,
             label=label,
             value=value,
@@ -69,8 +123,8 @@ class BaseAnalyzer(ABC):
         category: str,
         evidence: Optional[List[str]] = None,
     ) -> AnalysisFinding:
-        """Construye un AnalysisFinding de forma concisa."""
-        return AnalysisFinding(
+        """Construye un AnalysisFinding de forma concisa (sin validación, ver metric)."""
+        return AnalysisFinding.model_construct(
             title=title,
             description=description,
             severity=severity,
@@ -96,33 +150,46 @@ class BaseAnalyzer(ABC):
             return default
         return numerator / denominator
 
+    @staticmethod
+    def flatten_events(safety_events: Any) -> List[Dict]:
+        """
+        Extrae una lista plana de eventos desde la estructura de Samsara.
+        Las listas ya planas se devuelven sin copiar; las paginadas
+        ({"events": [...]}) se aplanan con chain.from_iterable.
+        """
+        if isinstance(safety_events, dict):
+            data = safety_events.get("data", safety_events.get("events", []))
+            return data if isinstance(data, list) else []
+        if not isinstance(safety_events, list) or not safety_events:
+            return []
+        first = safety_events[0]
+        if not (isinstance(first, dict) and "events" in first):
+            return safety_events
+        return list(chain.from_iterable(
+            item["events"] if isinstance(item, dict) and "events" in item else (item,)
+            for item in safety_events
+        ))
+
     @staticmethod
     def parse_iso_timestamp(ts: Optional[str]) -> Optional[datetime]:
         """Parsea un timestamp ISO 8601 de forma segura."""
         if not ts:
             return None
-        try:
-            # Handle various ISO formats
-            ts = ts.replace("Z", "+00:00")
-            return datetime.fromisoformat(ts)
-        except (ValueError, TypeError):
-            return None
+        return _parse_iso(ts)
 
     @staticmethod
     def get_hour_from_timestamp(ts: Optional[str]) -> Optional[int]:
         """Obtiene la hora (0-23) de un timestamp ISO."""
-        dt = BaseAnalyzer.parse_iso_timestamp(ts)
-        if dt:
-            return dt.hour
-        return None
+        if not ts:
+            return None
+        return _hour_of(ts)
 
     @staticmethod
     def build_data_window(parameters: Dict[str, Any]) -> Dict[str, Any]:
         """Construye la ventana temporal del análisis."""
         days_back = parameters.get("days_back", 7)
-        now = datetime.now(timezone.utc)
         return {
             "days_back": days_back,
-            "end": now.isoformat(),
+            "end": _now_iso(),
             "description": f"Ultimos {days_back} dias",
         }
@@ -5,11 +5,11 @@ y tendencias de comportamiento.
 """
 
 import logging
-from collections import Counter, defaultdict
-from typing import Any, Dict, List
+from collections import Counter
+from typing import Any, Dict, List, Tuple
 
 from api.analysis_models import RiskLevel, TrendDirection
-from .base import BaseAnalyzer
+from .base import RISK_LEVEL_TEXT, BaseAnalyzer
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +42,26 @@ EVENT_SEVERITY_WEIGHTS: Dict[str, float] = {
 # Peso por defecto para tipos no mapeados
 DEFAULT_EVENT_WEIGHT = 3.0
 
+# Tipos considerados criticos (peso >= 15), precalculados al importar
+CRITICAL_EVENT_TYPES = frozenset(
+    t for t, weight in EVENT_SEVERITY_WEIGHTS.items() if weight >= 15
+)
+
+
+def _get_event_type(event: Dict) -> str:
+    """Obtiene el tipo de evento en formato legible."""
+    # Intentar behaviorLabels (formato stream)
+    labels = event.get("behaviorLabels")
+    if labels and isinstance(labels, list):
+        first = labels[0]
+        return first.get("name") or first.get("label") or "Desconocido"
+    # Intentar behaviorLabel (formato legacy)
+    label = event.get("behaviorLabel", {})
+    if isinstance(label, dict):
+        return label.get("name") or label.get("label") or "Desconocido"
+    # Fallback
+    return event.get("type_description") or event.get("type") or "Desconocido"
+
 
 class DriverRiskAnalyzer(BaseAnalyzer):
     """Analiza el perfil de riesgo de un conductor basado en eventos de seguridad."""
@@ -56,24 +76,20 @@ class DriverRiskAnalyzer(BaseAnalyzer):
         driver_name = parameters.get("driver_name", "Conductor")
 
         # Extraer eventos
-        all_events = self._flatten_events(safety_events)
+        all_events = self.flatten_events(safety_events)
         total_events = len(all_events)
 
-        # Calcular score de riesgo (0-100)
-        risk_score = self._calculate_risk_score(all_events, days_back)
-
-        # Distribución por tipo
-        type_distribution = self._event_type_distribution(all_events)
-
-        # Distribución por hora del día
-        hour_distribution = self._hour_distribution(all_events)
+        # Distribuciones por tipo, hora del día y severidad (una sola pasada)
+        type_distribution, hour_distribution, severity_dist, dated_events = self._aggregate(
+            all_events,
+        )
         peak_hours = self._find_peak_hours(hour_distribution)
 
-        # Distribución por severidad
-        severity_dist = self._severity_distribution(all_events)
+        # Calcular score de riesgo (0-100)
+        risk_score = self._calculate_risk_score(type_distribution, days_back)
 
         # Tendencia (si hay suficientes datos)
-        trend = self._calculate_trend(all_events, days_back)
+        trend = self._calculate_trend(dated_events, days_back)
 
         # Métricas
         risk_level = self.compute_risk_level(risk_score)
@@ -137,8 +153,7 @@ class DriverRiskAnalyzer(BaseAnalyzer):
             ))
 
         # Eventos criticos
-        critical_types = [t for t, _ in type_distribution
-                          if EVENT_SEVERITY_WEIGHTS.get(t, 0) >= 15]
+        critical_types = [t for t, _ in type_distribution if t in CRITICAL_EVENT_TYPES]
         if critical_types:
             findings.append(self.finding(
                 title="Eventos criticos recurrentes",
@@ -159,7 +174,7 @@ class DriverRiskAnalyzer(BaseAnalyzer):
 
         return {
             "title": f"Perfil de Riesgo: {driver_name}",
-            "summary": self._build_summary(driver_name, risk_score, total_events, days_back),
+            "summary": self._build_summary(driver_name, risk_level, risk_score, total_events, days_back),
             "metrics": metrics,
             "findings": findings,
             "risk_level": risk_level,
@@ -182,35 +197,22 @@ class DriverRiskAnalyzer(BaseAnalyzer):
     # PRIVATE
     # =========================================================================
 
-    def _flatten_events(self, safety_events: Any) -> List[Dict]:
-        """Extrae una lista plana de eventos desde la estructura de Samsara."""
-        events = []
-        if isinstance(safety_events, dict):
-            data = safety_events.get("data", safety_events.get("events", []))
-            if isinstance(data, list):
-                events = data
-        elif isinstance(safety_events, list):
-            for item in safety_events:
-                if isinstance(item, dict) and "events" in item:
-                    events.extend(item["events"])
-                else:
-                    events.append(item)
-        return events
-
-    def _calculate_risk_score(self, events: List[Dict], days: int) -> float:
+    def _calculate_risk_score(self, type_distribution: List[tuple], days: int) -> float:
         """
         Calcula score de riesgo (0-100).
         Factores: cantidad, severidad ponderada, frecuencia, diversidad.
+
+        Trabaja sobre la distribución por tipo (peso x conteo por tipo distinto)
+        en lugar de recorrer de nuevo cada evento.
         """
-        if not events:
+        if not type_distribution:
             return 0.0
 
         # Puntuación ponderada total
         weighted_sum = 0.0
-        for event in events:
-            event_type = self._get_event_type(event)
-            weight = EVENT_SEVERITY_WEIGHTS.get(event_type, DEFAULT_EVENT_WEIGHT)
-            weighted_sum += weight
+        get_weight = EVENT_SEVERITY_WEIGHTS.get
+        for event_type, count in type_distribution:
+            weighted_sum += get_weight(event_type, DEFAULT_EVENT_WEIGHT) * count
 
         # Normalizar: un conductor "perfecto" tiene 0, uno peligroso > 100
         # Base: 5 puntos por día como umbral normal
@@ -220,62 +222,55 @@ class DriverRiskAnalyzer(BaseAnalyzer):
         # Cap at 100
         return min(raw_score, 100.0)
 
-    def _event_type_distribution(self, events: List[Dict]) -> List[tuple]:
-        """Distribución de eventos por tipo, ordenada por frecuencia."""
-        counter = Counter()
-        for event in events:
-            event_type = self._get_event_type(event)
-            counter[event_type] += 1
-        return counter.most_common()
+    def _aggregate(
+        self, events: List[Dict],
+    ) -> Tuple[List[tuple], Dict[int, int], Dict[str, int], int]:
+        """
+        Distribuciones por tipo (ordenada por frecuencia), hora del día y
+        severidad, calculadas en una sola pasada sobre los eventos.
+        También devuelve cuántos eventos tienen timestamp válido (para la tendencia).
+        """
+        types: Counter = Counter()
+        hours: Counter = Counter()
+        severities: Counter = Counter()
+        dated_events = 0
+        get_type = _get_event_type
+        parse_ts = self.parse_iso_timestamp
 
-    def _hour_distribution(self, events: List[Dict]) -> Dict[int, int]:
-        """Distribución de eventos por hora del día."""
-        hours: Dict[int, int] = defaultdict(int)
         for event in events:
+            types[get_type(event)] += 1
+
             ts = event.get("createdAtTime") or event.get("timestamp") or event.get("time")
-            hour = self.get_hour_from_timestamp(ts)
-            if hour is not None:
-                hours[hour] += 1
-        return dict(hours)
+            dt = parse_ts(ts)
+            if dt:
+                dated_events += 1
+                hours[dt.hour] += 1
+
+            severity = event.get("severity") or event.get("eventState") or "unknown"
+            severities[severity] += 1
+
+        return types.most_common(), hours, severities, dated_events
 
     def _find_peak_hours(self, hour_dist: Dict[int, int]) -> List[int]:
         """Encuentra las horas con más eventos."""
         if not hour_dist:
             return []
-        avg = sum(hour_dist.values()) / max(len(hour_dist), 1)
-        peak = [h for h, count in hour_dist.items() if count > avg]
-        return sorted(peak)
-
-    def _severity_distribution(self, events: List[Dict]) -> Dict[str, int]:
-        """Distribución de eventos por severidad."""
-        counter: Dict[str, int] = defaultdict(int)
-        for event in events:
-            severity = event.get("severity") or event.get("eventState") or "unknown"
-            counter[severity] += 1
-        return dict(counter)
+        avg = sum(hour_dist.values()) / len(hour_dist)
+        return sorted(h for h, count in hour_dist.items() if count > avg)
 
-    def _calculate_trend(self, events: List[Dict], days: int) -> Dict[str, Any]:
+    def _calculate_trend(self, dated_events: int, days: int) -> Dict[str, Any]:
         """
         Calcula la tendencia comparando primera mitad vs segunda mitad del período.
+        Recibe el número de eventos con timestamp válido (contado en _aggregate);
+        las mitades se definen por posición, así que basta con el conteo.
         """
-        if len(events) < 4 or days < 2:
+        if dated_events < 4 or days < 2:
             return {"direction": TrendDirection.STABLE, "label": "Datos insuficientes"}
 
-        # Separar en dos mitades por timestamp
-        timestamps = []
-        for event in events:
-            ts = event.get("createdAtTime") or event.get("timestamp") or event.get("time")
-            dt = self.parse_iso_timestamp(ts)
-            if dt:
-                timestamps.append(dt)
-
-        if len(timestamps) < 4:
-            return {"direction": TrendDirection.STABLE, "label": "Datos insuficientes"}
-
-        timestamps.sort()
-        mid = len(timestamps) // 2
+        # Separar en dos mitades
+        mid = dated_events // 2
         first_half = mid
-        second_half = len(timestamps) - mid
+        second_half = dated_events - mid
 
         # Calcular tasas
         half_days = max(days / 2, 1)
@@ -295,30 +290,11 @@ class DriverRiskAnalyzer(BaseAnalyzer):
             return {"direction": TrendDirection.DOWN, "label": f"{round(change_pct)}%"}
         return {"direction": TrendDirection.STABLE, "label": "Estable"}
 
-    def _get_event_type(self, event: Dict) -> str:
-        """Obtiene el tipo de evento en formato legible."""
-        # Intentar behaviorLabels (formato stream)
-        labels = event.get("behaviorLabels", [])
-        if labels and isinstance(labels, list):
-            first = labels[0]
-            return first.get("name") or first.get("label") or "Desconocido"
-        # Intentar behaviorLabel (formato legacy)
-        label = event.get("behaviorLabel", {})
-        if isinstance(label, dict):
-            return label.get("name") or label.get("label") or "Desconocido"
-        # Fallback
-        return event.get("type_description") or event.get("type") or "Desconocido"
-
-    def _build_summary(self, name: str, score: float, total: int, days: int) -> str:
+    def _build_summary(
+        self, name: str, risk_level: RiskLevel, score: float, total: int, days: int,
+    ) -> str:
         """Genera un resumen ejecutivo de una línea."""
-        level = self.compute_risk_level(score)
-        level_text = {
-            RiskLevel.LOW: "bajo",
-            RiskLevel.MEDIUM: "moderado",
-            RiskLevel.HIGH: "alto",
-            RiskLevel.CRITICAL: "critico",
-        }
         return (
-            f"{name}: riesgo {level_text[level]} ({round(score)}/100) "
+            f"{name}: riesgo {RISK_LEVEL_TEXT[risk_level]} ({round(score)}/100) "
             f"con {total} eventos en {days} dias."
         )
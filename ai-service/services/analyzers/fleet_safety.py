@@ -5,14 +5,49 @@ top ofensores, distribución por tipo y tendencia general.
 """
 
 import logging
-from collections import Counter, defaultdict
+import re
+from collections import Counter
+from heapq import nlargest
+from operator import itemgetter
 from typing import Any, Dict, List, Tuple
 
 from api.analysis_models import RiskLevel, TrendDirection
-from .base import BaseAnalyzer
+from .base import RISK_LEVEL_TEXT, BaseAnalyzer
 
 logger = logging.getLogger(__name__)
 
+# Palabras clave de tipos de evento criticos (match por substring, sin mayusculas)
+_CRITICAL_TYPE_RE = re.compile(r"colision|choque|somnolencia|bebiendo|crash", re.IGNORECASE)
+
+
+# Extractores de campos por evento (funciones de módulo: se usan en el loop caliente)
+def _get_event_type(event: Dict) -> str:
+    labels = event.get("behaviorLabels")
+    if labels and isinstance(labels, list):
+        first = labels[0]
+        return first.get("name") or first.get("label") or "Desconocido"
+    label = event.get("behaviorLabel", {})
+    if isinstance(label, dict):
+        return label.get("name") or label.get("label") or "Desconocido"
+    return event.get("type_description") or event.get("type") or "Desconocido"
+
+
+def _get_vehicle_name(event: Dict) -> str:
+    asset = event.get("asset")
+    if asset and asset.get("name"):
+        return asset["name"]
+    vehicle = event.get("vehicle", {})
+    if isinstance(vehicle, dict):
+        return vehicle.get("name") or "Desconocido"
+    return "Desconocido"
+
+
+def _get_driver_name(event: Dict) -> str:
+    driver = event.get("driver")
+    if isinstance(driver, dict) and driver.get("name"):
+        return driver["name"]
+    return "Sin conductor asignado"
+
 
 class FleetSafetyAnalyzer(BaseAnalyzer):
     """Genera un resumen ejecutivo de seguridad de toda la flota."""
@@ -25,21 +60,18 @@ class FleetSafetyAnalyzer(BaseAnalyzer):
         safety_events = raw_data.get("safety_events", [])
         days_back = parameters.get("days_back", 7)
 
-        all_events = self._flatten_events(safety_events)
+        all_events = self.flatten_events(safety_events)
         total = len(all_events)
 
         # Distribuciones
-        by_type = self._count_by_field(all_events, self._get_event_type)
-        by_vehicle = self._count_by_field(all_events, self._get_vehicle_name)
-        by_driver = self._count_by_field(all_events, self._get_driver_name)
-        hour_dist = self._hour_distribution(all_events)
+        by_type, by_vehicle, by_driver, hour_dist, dated_events = self._aggregate(all_events)
 
-        # Top ofensores
-        top_vehicles = by_vehicle[:5]
-        top_drivers = by_driver[:5]
+        # Top ofensores (most_common(k) usa heapq en vez de ordenar todo)
+        top_vehicles = by_vehicle.most_common(5)
+        top_drivers = by_driver.most_common(5)
 
         # Tendencia
-        trend = self._compute_trend(all_events, days_back)
+        trend = self._compute_trend(dated_events, days_back)
 
         # Risk level
         events_per_day = self.safe_div(total, days_back)
@@ -93,81 +125,51 @@ class FleetSafetyAnalyzer(BaseAnalyzer):
     # PRIVATE
     # =========================================================================
 
-    def _flatten_events(self, safety_events: Any) -> List[Dict]:
-        events = []
-        if isinstance(safety_events, dict):
-            data = safety_events.get("data", safety_events.get("events", []))
-            if isinstance(data, list):
-                events = data
-        elif isinstance(safety_events, list):
-            for item in safety_events:
-                if isinstance(item, dict) and "events" in item:
-                    events.extend(item["events"])
-                else:
-                    events.append(item)
-        return events
-
-    def _count_by_field(self, events: List[Dict], extractor) -> List[Tuple[str, int]]:
-        counter = Counter()
-        for event in events:
-            val = extractor(event)
-            if val:
-                counter[val] += 1
-        return counter.most_common()
-
-    def _get_event_type(self, event: Dict) -> str:
-        labels = event.get("behaviorLabels", [])
-        if labels and isinstance(labels, list):
-            first = labels[0]
-            return first.get("name") or first.get("label") or "Desconocido"
-        label = event.get("behaviorLabel", {})
-        if isinstance(label, dict):
-            return label.get("name") or label.get("label") or "Desconocido"
-        return event.get("type_description") or event.get("type") or "Desconocido"
-
-    def _get_vehicle_name(self, event: Dict) -> str:
-        asset = event.get("asset", {})
-        if asset and asset.get("name"):
-            return asset["name"]
-        vehicle = event.get("vehicle", {})
-        if isinstance(vehicle, dict):
-            return vehicle.get("name") or "Desconocido"
-        return "Desconocido"
-
-    def _get_driver_name(self, event: Dict) -> str:
-        driver = event.get("driver", {})
-        if isinstance(driver, dict) and driver.get("name"):
-            return driver["name"]
-        return "Sin conductor asignado"
-
-    def _hour_distribution(self, events: List[Dict]) -> Dict[int, int]:
-        hours: Dict[int, int] = defaultdict(int)
-        for event in events:
-            ts = event.get("createdAtTime") or event.get("timestamp") or event.get("time")
-            hour = self.get_hour_from_timestamp(ts)
-            if hour is not None:
-                hours[hour] += 1
-        return dict(hours)
-
-    def _compute_trend(self, events: List[Dict], days: int) -> Dict[str, Any]:
-        if len(events) < 4 or days < 2:
-            return {"direction": TrendDirection.STABLE, "label": "Datos insuficientes"}
+    def _aggregate(
+        self, events: List[Dict],
+    ) -> Tuple[List[Tuple[str, int]], Counter, Counter, Dict[int, int], int]:
+        """
+        Calcula en una sola pasada las distribuciones por tipo, vehículo,
+        conductor y hora del día, junto con el número de eventos con
+        timestamp válido que usa la tendencia. Los conteos por vehículo y
+        conductor se devuelven sin ordenar: solo se necesita su top 5.
+        """
+        by_type: Counter = Counter()
+        by_vehicle: Counter = Counter()
+        by_driver: Counter = Counter()
+        hours: Counter = Counter()
+        dated_events = 0
+        get_type, get_vehicle, get_driver = _get_event_type, _get_vehicle_name, _get_driver_name
+        parse_ts = self.parse_iso_timestamp
 
-        timestamps = []
         for event in events:
+            by_type[get_type(event)] += 1
+            by_vehicle[get_vehicle(event)] += 1
+            by_driver[get_driver(event)] += 1
+
             ts = event.get("createdAtTime") or event.get("timestamp") or event.get("time")
-            dt = self.parse_iso_timestamp(ts)
+            dt = parse_ts(ts)
             if dt:
-                timestamps.append(dt)
+                dated_events += 1
+                hours[dt.hour] += 1
 
-        if len(timestamps) < 4:
+        return (
+            by_type.most_common(),
+            by_vehicle,
+            by_driver,
+            hours,
+            dated_events,
+        )
+
+    def _compute_trend(self, dated_events: int, days: int) -> Dict[str, Any]:
+        if dated_events < 4 or days < 2:
             return {"direction": TrendDirection.STABLE, "label": "Datos insuficientes"}
 
-        timestamps.sort()
-        mid = len(timestamps) // 2
+        # Las mitades solo dependen del conteo de eventos con timestamp
+        mid = dated_events // 2
         half_days = max(days / 2, 1)
         rate_first = mid / half_days
-        rate_second = (len(timestamps) - mid) / half_days
+        rate_second = (dated_events - mid) / half_days
 
         if rate_first == 0:
             return {"direction": TrendDirection.UP, "label": "En aumento"} if rate_second > 0 \
@@ -182,11 +184,7 @@ class FleetSafetyAnalyzer(BaseAnalyzer):
 
     def _fleet_risk(self, events_per_day: float, by_type: List[Tuple[str, int]]) -> RiskLevel:
         """Determina riesgo de flota en base a tasa diaria y tipos criticos."""
-        critical_keywords = {"colision", "choque", "somnolencia", "bebiendo", "crash"}
-        has_critical = any(
-            any(kw in t.lower() for kw in critical_keywords)
-            for t, _ in by_type
-        )
+        has_critical = any(_CRITICAL_TYPE_RE.search(t) for t, _ in by_type)
         if has_critical or events_per_day > 10:
             return RiskLevel.CRITICAL if events_per_day > 15 else RiskLevel.HIGH
         if events_per_day > 5:
@@ -259,7 +257,7 @@ class FleetSafetyAnalyzer(BaseAnalyzer):
 
         # Hour patterns
         if hour_dist:
-            peak_hours = sorted(hour_dist.keys(), key=lambda h: hour_dist[h], reverse=True)[:3]
+            peak_hours = [h for h, _ in nlargest(3, hour_dist.items(), key=itemgetter(1))]
             findings.append(self.finding(
                 title="Horas de mayor incidencia",
                 description=f"Las horas con mas eventos son: "
@@ -271,13 +269,7 @@ class FleetSafetyAnalyzer(BaseAnalyzer):
         return findings
 
     def _build_summary(self, total: int, days: int, vehicles: int, risk: RiskLevel) -> str:
-        level_text = {
-            RiskLevel.LOW: "bajo",
-            RiskLevel.MEDIUM: "moderado",
-            RiskLevel.HIGH: "alto",
-            RiskLevel.CRITICAL: "critico",
-        }
         return (
             f"{total} eventos de seguridad en {days} dias involucrando {vehicles} vehiculos. "
-            f"Nivel de riesgo general: {level_text[risk]}."
+            f"Nivel de riesgo general: {RISK_LEVEL_TEXT[risk]}."
         )
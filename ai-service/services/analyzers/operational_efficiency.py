@@ -5,14 +5,28 @@ y patrones de consumo de combustible.
 """
 
 import logging
-from collections import defaultdict
-from typing import Any, Dict, List, Optional
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
 
 from api.analysis_models import RiskLevel, TrendDirection
 from .base import BaseAnalyzer
 
 logger = logging.getLogger(__name__)
 
+# Dict vacío compartido (solo lectura) para viajes sin "asset"
+_NO_ASSET: Dict[str, Any] = {}
+
+
+def _normalized_array(values: List[float], divisor: float) -> np.ndarray:
+    """
+    Convierte los valores crudos a un array float64 y normaliza de forma
+    vectorizada los que vienen en unidades pequeñas (> 1000 => ms o metros).
+    """
+    arr = np.fromiter(values, dtype=np.float64, count=len(values))
+    return np.where(arr > 1000, arr / divisor, arr)
+
 
 class OperationalEfficiencyAnalyzer(BaseAnalyzer):
     """Analiza la eficiencia operativa de la flota basado en viajes y estadísticas."""
@@ -30,18 +44,23 @@ class OperationalEfficiencyAnalyzer(BaseAnalyzer):
         trips = self._flatten_trips(trips_data)
         total_trips = len(trips)
 
-        # Métricas de viajes
-        trip_metrics = self._analyze_trips(trips, days_back)
+        if not trips and not vehicle_stats:
+            # Sin viajes ni datos de flota: resultado "sin actividad" directo
+            trip_metrics: Dict[str, Any] = {}
+            utilization: Dict[str, Any] = {"active_vehicles": 0}
+        else:
+            # Métricas de viajes (y vehículos con al menos un viaje)
+            trip_metrics, active_vehicles = self._analyze_trips(trips, days_back)
 
-        # Métricas de utilización
-        utilization = self._analyze_utilization(trips, vehicle_stats, days_back)
+            # Métricas de utilización
+            utilization = self._analyze_utilization(active_vehicles, vehicle_stats, days_back)
 
         # Componer métricas
         metrics = [
             self.metric("total_trips", "Total de Viajes", total_trips, unit="viajes"),
             self.metric(
                 "trips_per_day", "Viajes por Dia",
-                round(self.safe_div(total_trips, days_back), 1), unit="viajes/dia",
+                round(total_trips / days_back if days_back else 0.0, 1), unit="viajes/dia",
             ),
         ]
 
@@ -106,12 +125,18 @@ class OperationalEfficiencyAnalyzer(BaseAnalyzer):
     # =========================================================================
 
     def _flatten_trips(self, trips_data: Any) -> List[Dict]:
+        """
+        Extrae una lista plana de viajes. Si la lista no contiene páginas
+        ({"trips": [...]}) se devuelve tal cual, sin copiarla.
+        """
         trips = []
         if isinstance(trips_data, dict):
             data = trips_data.get("data", trips_data.get("trips", []))
             if isinstance(data, list):
                 trips = data
         elif isinstance(trips_data, list):
+            if not any(isinstance(item, dict) and "trips" in item for item in trips_data):
+                return trips_data
             for item in trips_data:
                 if isinstance(item, dict) and "trips" in item:
                     trips.extend(item["trips"])
@@ -119,86 +144,86 @@ class OperationalEfficiencyAnalyzer(BaseAnalyzer):
                     trips.append(item)
         return trips
 
-    def _analyze_trips(self, trips: List[Dict], days: int) -> Dict[str, Any]:
+    def _analyze_trips(self, trips: List[Dict], days: int) -> Tuple[Dict[str, Any], set]:
+        """
+        Métricas agregadas de los viajes. Devuelve también el set de vehículos
+        con viajes, que reutiliza _analyze_utilization.
+        """
         if not trips:
-            return {}
+            return {}, set()
 
         durations = []
         distances = []
         idle_times = []
-        statuses: Dict[str, int] = defaultdict(int)
+        statuses: List[str] = []
         vehicles: set = set()
+        add_duration, add_distance, add_idle = durations.append, distances.append, idle_times.append
+        add_status = statuses.append
 
         for trip in trips:
+            get = trip.get
+
             # Duración
-            duration = trip.get("duration_minutes") or trip.get("durationMs")
+            duration = get("duration_minutes") or get("durationMs")
             if duration is not None:
-                if isinstance(duration, (int, float)) and duration > 1000:
-                    # Probablemente en ms
-                    duration = duration / 60000
-                durations.append(float(duration))
+                add_duration(float(duration))
 
             # Distancia
-            dist = trip.get("distance_km") or trip.get("distanceMeters")
+            dist = get("distance_km") or get("distanceMeters")
             if dist is not None:
-                dist = float(dist)
-                if dist > 1000:
-                    dist = dist / 1000  # metros a km
-                distances.append(dist)
+                add_distance(float(dist))
 
             # Idle time
-            idle = trip.get("idleDurationMs") or trip.get("idle_minutes")
+            idle = get("idleDurationMs") or get("idle_minutes")
             if idle is not None:
-                idle = float(idle)
-                if idle > 1000:
-                    idle = idle / 60000
-                idle_times.append(idle)
+                add_idle(float(idle))
 
             # Status
-            status = trip.get("tripState") or trip.get("status") or trip.get("status_description") or "unknown"
-            statuses[status] += 1
+            status = get("tripState") or get("status") or get("status_description") or "unknown"
+            add_status(status)
 
             # Vehicle tracking
-            asset = trip.get("asset", {})
-            vid = asset.get("id") or trip.get("vehicle_id")
+            asset = get("asset") or _NO_ASSET
+            vid = asset.get("id") or get("vehicle_id")
             if vid:
                 vehicles.add(vid)
 
         result: Dict[str, Any] = {
             "vehicles_with_trips": len(vehicles),
-            "status_distribution": dict(statuses),
+            # Counter sobre la lista cuenta en C
+            "status_distribution": dict(Counter(statuses)),
         }
 
-        if durations:
-            result["avg_duration_min"] = sum(durations) / len(durations)
-            result["total_duration_min"] = sum(durations)
+        # Agregación numérica vectorizada (> 1000 => ms a min, metros a km).
+        # Cada total se reduce una sola vez; los promedios se derivan de él.
+        dur_n, dist_n = len(durations), len(distances)
+        dur_sum = float(_normalized_array(durations, 60000).sum()) if dur_n else 0.0
 
-        if distances:
-            result["total_distance_km"] = sum(distances)
-            result["avg_distance_km"] = sum(distances) / len(distances)
+        if dur_n:
+            result["avg_duration_min"] = dur_sum / dur_n
+            result["total_duration_min"] = dur_sum
 
-        if idle_times and durations:
-            total_idle = sum(idle_times)
-            total_dur = sum(durations) if sum(durations) > 0 else 1
+        if dist_n:
+            dist_sum = float(_normalized_array(distances, 1000).sum())
+            result["total_distance_km"] = dist_sum
+            result["avg_distance_km"] = dist_sum / dist_n
+
+        if idle_times and dur_n:
+            total_idle = float(_normalized_array(idle_times, 60000).sum())
             result["total_idle_min"] = total_idle
-            result["idle_ratio"] = total_idle / total_dur
+            result["idle_ratio"] = total_idle / (dur_sum or 1)
 
-        return result
+        return result, vehicles
 
     def _analyze_utilization(
-        self, trips: List[Dict], vehicle_stats: Any, days: int,
+        self, active_vehicles: set, vehicle_stats: Any, days: int,
     ) -> Dict[str, Any]:
-        """Calcula tasa de utilización de la flota."""
+        """
+        Calcula tasa de utilización de la flota.
+        active_vehicles son los vehículos con al menos un viaje (de _analyze_trips).
+        """
         result: Dict[str, Any] = {}
 
-        # Contar vehículos activos (con al menos un viaje)
-        active_vehicles = set()
-        for trip in trips:
-            asset = trip.get("asset", {})
-            vid = asset.get("id") or trip.get("vehicle_id")
-            if vid:
-                active_vehicles.add(vid)
-
         result["active_vehicles"] = len(active_vehicles)
 
         # Si tenemos datos de flota total
@@ -7,8 +7,10 @@ para detectar anomalías y predecir necesidades de mantenimiento.
 import logging
 from typing import Any, Dict, List, Optional
 
+import numpy as np
+
 from api.analysis_models import RiskLevel, TrendDirection
-from .base import BaseAnalyzer
+from .base import RISK_LEVEL_RANK, BaseAnalyzer
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +26,30 @@ THRESHOLDS = {
     "rpm_high": 4000,             # RPM
 }
 
+# Penalización del health score por severidad, indexada por RISK_LEVEL_RANK
+_SEVERITY_PENALTY = (0, 15, 30, 50)
+_SEVERITY_PENALTY_ARRAY = np.array(_SEVERITY_PENALTY, dtype=np.float64)
+
+# Severidades de hallazgo que cuentan como alerta en el resumen
+_ALERT_LEVELS = frozenset((RiskLevel.HIGH, RiskLevel.CRITICAL))
+
+# Niveles de riesgo ordenados por rank (inverso de RISK_LEVEL_RANK)
+_LEVELS_BY_RANK = tuple(sorted(RISK_LEVEL_RANK, key=RISK_LEVEL_RANK.__getitem__))
+
+# Claves canónicas y sus alternativas posibles: los stats pueden venir en
+# formato de Samsara directo o del Tool (español). Se toma la primera presente.
+_STATS_KEY_MAP = (
+    ("battery_voltage", ("bateria_voltaje", "batteryMilliVolts", "battery_voltage")),
+    ("coolant_celsius", ("refrigerante_celsius", "engineCoolantTemperatureMilliC", "coolant_temp")),
+    ("fuel_percent", ("combustible_porcentaje", "fuelPercent", "fuel_percent")),
+    ("engine_load", ("motor_carga_porcentaje", "engineLoadPercent", "engine_load")),
+    ("engine_rpm", ("motor_rpm", "engineRpm", "rpm")),
+    ("engine_state", ("motor_estado", "engineState", "engine_state")),
+    ("odometer_km", ("odometro_km", "odometerMeters", "odometer")),
+    ("has_faults", ("tiene_fallas", "obdDtcCodes", "has_faults")),
+    ("ambient_temp", ("temperatura_ambiente_celsius", "ambientAirTemperatureMilliC")),
+)
+
 
 class VehicleHealthAnalyzer(BaseAnalyzer):
     """Analiza la salud de un vehículo basado en sus estadísticas."""
@@ -57,8 +83,7 @@ class VehicleHealthAnalyzer(BaseAnalyzer):
 
         # Determinar riesgo general
         severities = [c["severity"] for c in all_checks if c]
-        risk_level = max(severities, default=RiskLevel.LOW,
-                         key=lambda s: ["low", "medium", "high", "critical"].index(s.value))
+        risk_level = max(severities, default=RiskLevel.LOW, key=RISK_LEVEL_RANK.__getitem__)
 
         # Hallazgos
         findings = []
@@ -99,6 +124,64 @@ class VehicleHealthAnalyzer(BaseAnalyzer):
             },
         }
 
+    def analyze_batch(self, vehicle_stats_list: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Health score y nivel de riesgo de muchos vehículos a la vez.
+
+        Aplica los mismos umbrales que analyze() pero con comparaciones
+        vectorizadas de NumPy (un array por indicador). No genera métricas
+        ni hallazgos: pensado para rankings/reportes de flota completa.
+        """
+        stats_list = [self._extract_stats(vs) for vs in vehicle_stats_list]
+        n = len(stats_list)
+        if n == 0:
+            return []
+
+        def column(key: str) -> np.ndarray:
+            # NaN marca el indicador ausente; toda comparación con NaN es False
+            return np.fromiter(
+                (np.nan if (v := s.get(key)) is None else float(v) for s in stats_list),
+                dtype=np.float64, count=n,
+            )
+
+        def present(key: str) -> np.ndarray:
+            return np.fromiter((s.get(key) is not None for s in stats_list), dtype=bool, count=n)
+
+        voltage = column("battery_voltage")
+        coolant = column("coolant_celsius")
+        fuel = column("fuel_percent")
+        load = column("engine_load")
+        faults = np.fromiter((bool(s.get("has_faults")) for s in stats_list), dtype=bool, count=n)
+
+        # Rank de severidad por check (ver RISK_LEVEL_RANK): filas = checks
+        ranks = np.stack([
+            np.where(voltage < THRESHOLDS["battery_critical"], 3,
+                     np.where(voltage < THRESHOLDS["battery_low"], 1, 0)),
+            np.where(coolant > THRESHOLDS["coolant_critical"], 3,
+                     np.where(coolant > THRESHOLDS["coolant_high"], 2, 0)),
+            np.where(fuel < THRESHOLDS["fuel_critical"], 2,
+                     np.where(fuel < THRESHOLDS["fuel_low"], 1, 0)),
+            np.where(load > THRESHOLDS["engine_load_high"], 1, 0),
+            np.where(faults, 2, 0),
+        ])
+        has_check = np.stack([
+            ~np.isnan(voltage),
+            ~np.isnan(coolant),
+            ~np.isnan(fuel),
+            ~np.isnan(load) | present("engine_rpm") | present("engine_state"),
+            present("has_faults"),
+        ])
+        ranks = np.where(has_check, ranks, 0)
+
+        penalty = _SEVERITY_PENALTY_ARRAY[ranks].sum(axis=0)
+        scores = np.where(has_check.any(axis=0), np.maximum(0.0, 100.0 - penalty), 100.0)
+        risk_ranks = ranks.max(axis=0)
+
+        return [
+            {"health_score": float(score), "risk_level": _LEVELS_BY_RANK[rank]}
+            for score, rank in zip(scores.tolist(), risk_ranks.tolist())
+        ]
+
     # =========================================================================
     # PRIVATE
     # =========================================================================
@@ -112,22 +195,11 @@ class VehicleHealthAnalyzer(BaseAnalyzer):
         stats = vehicle_stats.get("stats", vehicle_stats)
 
         result = {}
-        # Mapeo de claves posibles
-        mappings = {
-            "battery_voltage": ["bateria_voltaje", "batteryMilliVolts", "battery_voltage"],
-            "coolant_celsius": ["refrigerante_celsius", "engineCoolantTemperatureMilliC", "coolant_temp"],
-            "fuel_percent": ["combustible_porcentaje", "fuelPercent", "fuel_percent"],
-            "engine_load": ["motor_carga_porcentaje", "engineLoadPercent", "engine_load"],
-            "engine_rpm": ["motor_rpm", "engineRpm", "rpm"],
-            "engine_state": ["motor_estado", "engineState", "engine_state"],
-            "odometer_km": ["odometro_km", "odometerMeters", "odometer"],
-            "has_faults": ["tiene_fallas", "obdDtcCodes", "has_faults"],
-            "ambient_temp": ["temperatura_ambiente_celsius", "ambientAirTemperatureMilliC"],
-        }
+        get = stats.get
 
-        for canonical, alternatives in mappings.items():
+        for canonical, alternatives in _STATS_KEY_MAP:
             for alt in alternatives:
-                val = stats.get(alt)
+                val = get(alt)
                 if val is not None:
                     result[canonical] = val
                     break
@@ -247,8 +319,7 @@ class VehicleHealthAnalyzer(BaseAnalyzer):
         load = stats.get("engine_load")
         if load is not None:
             if load > THRESHOLDS["engine_load_high"]:
-                severity = max(severity, RiskLevel.MEDIUM,
-                               key=lambda s: ["low", "medium", "high", "critical"].index(s.value))
+                severity = max(severity, RiskLevel.MEDIUM, key=RISK_LEVEL_RANK.__getitem__)
                 findings.append(self.finding(
                     title="Carga del motor elevada",
                     description=f"Motor al {load}% de carga. Puede indicar sobreesfuerzo.",
@@ -304,15 +375,8 @@ class VehicleHealthAnalyzer(BaseAnalyzer):
         if not any(checks):
             return 100.0
 
-        penalties = {
-            RiskLevel.LOW: 0,
-            RiskLevel.MEDIUM: 15,
-            RiskLevel.HIGH: 30,
-            RiskLevel.CRITICAL: 50,
-        }
-
         total_penalty = sum(
-            penalties.get(c["severity"], 0)
+            _SEVERITY_PENALTY[RISK_LEVEL_RANK[c["severity"]]]
             for c in checks if c
         )
 
@@ -328,7 +392,7 @@ class VehicleHealthAnalyzer(BaseAnalyzer):
         return RiskLevel.CRITICAL
 
     def _build_summary(self, name: str, score: float, findings: List) -> str:
-        alert_count = len([f for f in findings if f.severity.value in ("high", "critical")])
+        alert_count = sum(1 for f in findings if f.severity in _ALERT_LEVELS)
         if alert_count == 0:
             return f"{name}: salud del vehiculo en buen estado ({round(score)}/100)."
         return (
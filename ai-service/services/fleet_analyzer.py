@@ -4,9 +4,13 @@ Selecciona el analizador correcto, ejecuta el análisis determinista,
 luego pasa los resultados al intérprete LLM y compone la respuesta final.
 """
 
+import asyncio
 import logging
+import random
 import time
-from typing import Any, Dict
+from typing import Any, Dict, List
+
+from pydantic import TypeAdapter
 
 from api.analysis_models import (
     AnalysisFinding,
@@ -15,7 +19,7 @@ from api.analysis_models import (
     AnalysisType,
     RiskLevel,
 )
-from config import langfuse_client
+from config import LangfuseConfig, langfuse_client
 from .analyzers import (
     AnomalyDetectionAnalyzer,
     DriverRiskAnalyzer,
@@ -27,6 +31,71 @@ from .analysis_interpreter import interpret_analysis
 
 logger = logging.getLogger(__name__)
 
+# Severidades cuyos hallazgos se usan como recomendación determinista
+# (miembros del enum y sus valores, para hallazgos serializados o dicts crudos)
+_RECOMMENDATION_SEVERITIES = frozenset({
+    RiskLevel.HIGH, RiskLevel.CRITICAL, RiskLevel.HIGH.value, RiskLevel.CRITICAL.value,
+})
+
+# Niveles de riesgo que siempre se trazan en Langfuse (además de los errores)
+_ALWAYS_TRACED_RISK_LEVELS = frozenset({RiskLevel.HIGH, RiskLevel.CRITICAL})
+
+# Serializadores de listas completas (se construyen una sola vez)
+_METRICS_ADAPTER = TypeAdapter(List[AnalysisMetric])
+_FINDINGS_ADAPTER = TypeAdapter(List[AnalysisFinding])
+
+
+def _summarize_parameters(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Versión compacta de los parámetros para Langfuse: los escalares se
+    conservan (strings truncados) y las colecciones se reducen a tipo y tamaño.
+    """
+    summary: Dict[str, Any] = {}
+    for key, value in parameters.items():
+        if value is None or isinstance(value, (bool, int, float)):
+            summary[key] = value
+        elif isinstance(value, str):
+            summary[key] = value[:100]
+        elif hasattr(value, "__len__"):
+            summary[key] = f"<{type(value).__name__} len={len(value)}>"
+        else:
+            summary[key] = f"<{type(value).__name__}>"
+    return summary
+
+
+def _elapsed_ms(start_ns: int) -> float:
+    """Milisegundos (2 decimales) desde start_ns, con reloj monotónico."""
+    return round((time.perf_counter_ns() - start_ns) / 1_000_000, 2)
+
+
+def _template_insights(summary: str, metrics: List[Dict[str, Any]]) -> str:
+    """
+    Insights sin LLM para análisis de riesgo bajo sin hallazgos graves.
+    Sigue el formato del prompt del intérprete (negritas, sin acentos).
+    """
+    lines = [
+        f"**Resumen Ejecutivo**: {summary} El riesgo general es bajo y no se "
+        "detectaron hallazgos graves en el periodo analizado.",
+    ]
+    metric_lines = [
+        f"- {m.get('label', m.get('key', ''))}: {m.get('value')}"
+        + (f" {m['unit']}" if m.get("unit") else "")
+        for m in metrics
+    ]
+    if metric_lines:
+        lines.append("**Analisis Operativo**:\n" + "\n".join(metric_lines))
+    return "\n\n".join(lines)
+
+
+def _dump_items(adapter: TypeAdapter, items: List[Any]) -> List[Any]:
+    """
+    Serializa métricas/hallazgos a dicts para el LLM. Si todos son modelos
+    se vuelca la lista completa de una vez; los dicts se dejan tal cual.
+    """
+    if any(isinstance(item, dict) for item in items):
+        return [item.model_dump() if hasattr(item, "model_dump") else item for item in items]
+    return adapter.dump_python(items)
+
 # Mapa de tipo de análisis a analizador
 ANALYZER_MAP = {
     AnalysisType.DRIVER_RISK_PROFILE: DriverRiskAnalyzer,
@@ -36,6 +105,9 @@ ANALYZER_MAP = {
     AnalysisType.ANOMALY_DETECTION: AnomalyDetectionAnalyzer,
 }
 
+# Instancias compartidas: los analizadores no guardan estado entre llamadas
+_ANALYZERS = {analysis_type: cls() for analysis_type, cls in ANALYZER_MAP.items()}
+
 
 class FleetAnalyzer:
     """
@@ -66,34 +138,34 @@ class FleetAnalyzer:
         Returns:
             AnalysisResponse con métricas, hallazgos e insights
         """
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
         trace = None
+        trace_parameters = _summarize_parameters(parameters) if langfuse_client else None
 
         try:
-            # Crear trace de Langfuse
-            if langfuse_client:
-                trace = langfuse_client.trace(
-                    name="fleet_analysis_on_demand",
-                    metadata={
-                        "analysis_type": analysis_type.value,
-                        "company_id": company_id,
-                        "parameters": parameters,
-                    },
-                    tags=["analysis", "on_demand", analysis_type.value],
-                )
+            # Crear trace de Langfuse (muestreado; errores y riesgo alto se
+            # trazan siempre, creando el trace más adelante si hace falta)
+            if langfuse_client and (
+                random.random() < LangfuseConfig.SAMPLE_RATE or parameters.get("_force_trace")
+            ):
+                trace = self._start_trace(analysis_type, company_id, trace_parameters)
 
             # ===================================================================
             # PASO 1: Análisis determinista
             # ===================================================================
-            logger.info(f"Starting deterministic analysis", extra={
-                "context": {
-                    "analysis_type": analysis_type.value,
-                    "company_id": company_id,
-                }
-            })
+            # Logs intermedios en DEBUG (solo se construyen si el nivel está activo);
+            # el resumen de la ejecución se loguea en INFO al final
+            debug_enabled = logger.isEnabledFor(logging.DEBUG)
+            if debug_enabled:
+                logger.debug("Starting deterministic analysis", extra={
+                    "context": {
+                        "analysis_type": analysis_type.value,
+                        "company_id": company_id,
+                    }
+                })
 
-            analyzer_class = ANALYZER_MAP.get(analysis_type)
-            if not analyzer_class:
+            analyzer = _ANALYZERS.get(analysis_type)
+            if not analyzer:
                 return AnalysisResponse(
                     status="error",
                     analysis_type=analysis_type.value,
@@ -103,23 +175,29 @@ class FleetAnalyzer:
                     error=f"Tipo de analisis no soportado: {analysis_type.value}",
                 )
 
-            analyzer = analyzer_class()
             deterministic_result = analyzer.analyze(raw_data, parameters)
 
-            det_duration = round((time.time() - start_time) * 1000, 2)
-            logger.info(f"Deterministic analysis completed in {det_duration}ms", extra={
-                "context": {
-                    "analysis_type": analysis_type.value,
-                    "metrics_count": len(deterministic_result.get("metrics", [])),
-                    "findings_count": len(deterministic_result.get("findings", [])),
-                    "risk_level": deterministic_result.get("risk_level", "unknown"),
-                }
-            })
+            det_duration = _elapsed_ms(start_ns)
+            if debug_enabled:
+                logger.debug(f"Deterministic analysis completed in {det_duration}ms", extra={
+                    "context": {
+                        "analysis_type": analysis_type.value,
+                        "metrics_count": len(deterministic_result.get("metrics", [])),
+                        "findings_count": len(deterministic_result.get("findings", [])),
+                        "risk_level": deterministic_result.get("risk_level", "unknown"),
+                    }
+                })
+
+            if (
+                langfuse_client and trace is None
+                and deterministic_result.get("risk_level") in _ALWAYS_TRACED_RISK_LEVELS
+            ):
+                trace = self._start_trace(analysis_type, company_id, trace_parameters)
 
             if trace:
                 trace.span(
                     name="deterministic_analysis",
-                    input={"parameters": parameters, "data_keys": list(raw_data.keys())},
+                    input={"parameters": trace_parameters, "data_keys": list(raw_data)[:20]},
                     output={
                         "metrics_count": len(deterministic_result.get("metrics", [])),
                         "findings_count": len(deterministic_result.get("findings", [])),
@@ -131,40 +209,54 @@ class FleetAnalyzer:
             # ===================================================================
             # PASO 2: Interpretación LLM
             # ===================================================================
-            llm_start = time.time()
+            llm_start_ns = time.perf_counter_ns()
 
             # Serializar métricas y hallazgos para el LLM
-            metrics_dicts = [
-                m.model_dump() if hasattr(m, "model_dump") else m
-                for m in deterministic_result.get("metrics", [])
-            ]
-            findings_dicts = [
-                f.model_dump() if hasattr(f, "model_dump") else f
-                for f in deterministic_result.get("findings", [])
-            ]
+            metrics_dicts = _dump_items(_METRICS_ADAPTER, deterministic_result.get("metrics", []))
+            findings_dicts = _dump_items(_FINDINGS_ADAPTER, deterministic_result.get("findings", []))
 
             risk_level = deterministic_result.get("risk_level", RiskLevel.LOW)
             risk_str = risk_level.value if hasattr(risk_level, "value") else str(risk_level)
 
-            interpretation = await interpret_analysis(
-                analysis_type=analysis_type.value,
-                title=deterministic_result.get("title", "Analisis"),
-                summary=deterministic_result.get("summary", ""),
-                metrics=metrics_dicts,
-                findings=findings_dicts,
-                risk_level=risk_str,
-                analysis_detail=deterministic_result.get("_analysis_detail", {}),
-                data_window=deterministic_result.get("data_window", {}),
+            # Riesgo bajo sin hallazgos high/critical: el LLM aporta poco,
+            # se usan insights de plantilla (force_llm=True lo evita)
+            skip_llm = (
+                risk_level == RiskLevel.LOW
+                and not parameters.get("force_llm")
+                and not any(
+                    f.get("severity") in _RECOMMENDATION_SEVERITIES for f in findings_dicts
+                )
             )
 
-            llm_duration = round((time.time() - llm_start) * 1000, 2)
-            logger.info(f"LLM interpretation completed in {llm_duration}ms", extra={
-                "context": {
-                    "analysis_type": analysis_type.value,
-                    "insights_length": len(interpretation.get("insights", "")),
-                    "recommendations_count": len(interpretation.get("recommendations", [])),
+            if skip_llm:
+                interpretation = {
+                    "insights": _template_insights(
+                        deterministic_result.get("summary", ""), metrics_dicts,
+                    ),
+                    "recommendations": [],
                 }
-            })
+            else:
+                interpretation = await interpret_analysis(
+                    analysis_type=analysis_type.value,
+                    title=deterministic_result.get("title", "Analisis"),
+                    summary=deterministic_result.get("summary", ""),
+                    metrics=metrics_dicts,
+                    findings=findings_dicts,
+                    risk_level=risk_str,
+                    analysis_detail=deterministic_result.get("_analysis_detail", {}),
+                    data_window=deterministic_result.get("data_window", {}),
+                )
+
+            llm_duration = _elapsed_ms(llm_start_ns)
+            if debug_enabled:
+                logger.debug(f"LLM interpretation completed in {llm_duration}ms", extra={
+                    "context": {
+                        "analysis_type": analysis_type.value,
+                        "insights_length": len(interpretation.get("insights", "")),
+                        "recommendations_count": len(interpretation.get("recommendations", [])),
+                        "skipped_llm": skip_llm,
+                    }
+                })
 
             if trace:
                 trace.span(
@@ -174,29 +266,23 @@ class FleetAnalyzer:
                         "insights_length": len(interpretation.get("insights", "")),
                         "recommendations_count": len(interpretation.get("recommendations", [])),
                     },
-                    metadata={"duration_ms": llm_duration},
+                    metadata={"duration_ms": llm_duration, "skipped_llm": skip_llm},
                 ).end()
 
             # ===================================================================
             # PASO 3: Componer respuesta final
             # ===================================================================
-            total_duration = round((time.time() - start_time) * 1000, 2)
+            total_duration = _elapsed_ms(start_ns)
 
             # Merge recommendations from deterministic + LLM
-            det_recommendations = []
-            for f in deterministic_result.get("findings", []):
-                if hasattr(f, "description"):
-                    sev = f.severity.value if hasattr(f.severity, "value") else f.severity
-                else:
-                    sev = f.get("severity", "low")
-                if sev in ("high", "critical"):
-                    desc = f.description if hasattr(f, "description") else f.get("description", "")
-                    if desc:
-                        det_recommendations.append(desc)
-
             llm_recommendations = interpretation.get("recommendations", [])
             # LLM recommendations first, then deterministic ones as fallback
-            all_recommendations = llm_recommendations or det_recommendations
+            # (findings_dicts ya está normalizado: un solo recorrido, sin hasattr)
+            all_recommendations = llm_recommendations or [
+                desc for f in findings_dicts
+                if f.get("severity", "low") in _RECOMMENDATION_SEVERITIES
+                and (desc := f.get("description", ""))
+            ]
 
             response = AnalysisResponse(
                 status="success",
@@ -218,7 +304,8 @@ class FleetAnalyzer:
                     "risk_level": risk_str,
                     "total_duration_ms": total_duration,
                 })
-                langfuse_client.flush()
+                if LangfuseConfig.FLUSH_PER_REQUEST:
+                    await asyncio.to_thread(langfuse_client.flush)
 
             logger.info(f"Fleet analysis completed in {total_duration}ms", extra={
                 "context": {
@@ -227,13 +314,15 @@ class FleetAnalyzer:
                     "total_duration_ms": total_duration,
                     "det_duration_ms": det_duration,
                     "llm_duration_ms": llm_duration,
+                    "risk_level": risk_str,
+                    "skipped_llm": skip_llm,
                 }
             })
 
             return response
 
         except Exception as e:
-            total_duration = round((time.time() - start_time) * 1000, 2)
+            total_duration = _elapsed_ms(start_ns)
             logger.error(f"Fleet analysis failed: {e}", extra={
                 "context": {
                     "analysis_type": analysis_type.value,
@@ -244,12 +333,16 @@ class FleetAnalyzer:
                 }
             })
 
+            if langfuse_client and trace is None:
+                trace = self._start_trace(analysis_type, company_id, trace_parameters)
+
             if trace:
                 trace.update(
                     level="ERROR",
                     status_message=str(e),
                 )
-                langfuse_client.flush()
+                if LangfuseConfig.FLUSH_PER_REQUEST:
+                    await asyncio.to_thread(langfuse_client.flush)
 
             return AnalysisResponse(
                 status="error",
@@ -259,3 +352,20 @@ class FleetAnalyzer:
                 risk_level=RiskLevel.LOW,
                 error=str(e),
             )
+
+    @staticmethod
+    def _start_trace(
+        analysis_type: AnalysisType,
+        company_id: int,
+        trace_parameters: Dict[str, Any],
+    ):
+        """Crea el trace de Langfuse del análisis."""
+        return langfuse_client.trace(
+            name="fleet_analysis_on_demand",
+            metadata={
+                "analysis_type": analysis_type.value,
+                "company_id": company_id,
+                "parameters": trace_parameters,
+            },
+            tags=["analysis", "on_demand", analysis_type.value],
+        )
@@ -13,84 +13,112 @@ NOTA: Las notificaciones se ejecutan en Laravel, no aquí.
 El AI Service solo devuelve la decisión de notificación.
 """
 
+import ast
+import asyncio
 import json
 import logging
 import re
+import time
 import uuid
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from google.genai import types
 
 logger = logging.getLogger(__name__)
 
-from config import ServiceConfig, langfuse_client
+from config import LangfuseConfig, ServiceConfig, langfuse_client
 from core import runner, revalidation_runner, session_service
 from core.context import current_langfuse_span, current_tool_tracker
-from agents.agent_definitions import AGENTS_BY_NAME
+from agents.agent_definitions import AGENT_TOOL_NAMES
 from agents.schemas import ToolResult, AgentResult, PipelineResult
 # NOTA: execute_notifications removido - Laravel ejecuta notificaciones via SendNotificationJob
-from .preloaded_media_analyzer import analyze_preloaded_media
+from .preloaded_media_analyzer import analyze_preloaded_media, has_preloaded_media
 from .response_builder import _fix_corrupted_encoding, _fix_dict_encoding
 
 
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
+# Patrones de _clean_markdown (compilados una sola vez)
+_CODE_BLOCK_RE = re.compile(r'```(?:json|JSON)?\s*\n?(.*?)\n?```', re.DOTALL)
+_LEADING_FENCE_RE = re.compile(r'^```\w*\s*', re.MULTILINE)
+_TRAILING_FENCE_RE = re.compile(r'\s*```$', re.MULTILINE)
+
+
+def _parse_tool_response(response: Any) -> Any:
+    """
+    Convierte la respuesta de una tool a dict cuando llega serializada.
+    Solo un objeto ({...}) puede dar un dict, así que el resto se devuelve tal cual.
+    """
+    if not isinstance(response, str) or not response.lstrip().startswith("{"):
+        return response
+    try:
+        return json.loads(response)
+    except ValueError:
+        pass
+    # Algunas tools devuelven el repr de un dict (comillas simples)
+    try:
+        return ast.literal_eval(response)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return response
+
+
+def _summarize_driver_assignment(response: Dict) -> str:
+    if not response.get('data', []):
+        return "Sin conductor asignado"
+    return "Conductor identificado"
+
+
+def _summarize_camera_media(response: Dict) -> str:
+    ai_analysis = response.get('ai_analysis', {})
+    if ai_analysis and 'analyses' in ai_analysis:
+        count = len(ai_analysis['analyses'])
+        return f"{count} imágenes analizadas"
+    data = response.get('data') or []
+    return f"{len(data)} elementos de media"
+
+
+# Resumen específico por tool; cualquier otra se resume como "Completado"
+_TOOL_SUMMARIZERS = {
+    "get_vehicle_stats": lambda response: "Estadísticas del vehículo obtenidas",
+    "get_vehicle_info": lambda response: "Información del vehículo obtenida",
+    "get_driver_assignment": _summarize_driver_assignment,
+    "get_safety_events": lambda response: f"{response.get('total_events', 0)} eventos de seguridad",
+    "get_camera_media": _summarize_camera_media,
+}
+
+# Keys que identifican el output JSON de cada agente (basta con una)
+_TRIAGE_KEYS = ("alert_type", "alert_kind")
+_ASSESSMENT_KEYS = ("likelihood", "verdict")
+_NOTIFICATION_DECISION_KEYS = ("should_notify",)
+
+# Campos obligatorios del assessment (en orden, para el mensaje de error)
+_ASSESSMENT_REQUIRED_FIELDS = ("verdict", "likelihood", "confidence", "risk_escalation")
+
+# Agentes cuyo output es JSON (el resto se resume truncando el texto)
+_JSON_OUTPUT_AGENTS = frozenset({
+    "triage_agent",
+    "investigator_agent",
+    "notification_decision_agent",
+})
+
+
 def _generate_tool_summary(tool_name: str, response: Any) -> str:
     """Genera un resumen conciso para la ejecución de una tool."""
-    try:
-        if isinstance(response, str):
-            try:
-                response = json.loads(response)
-            except:
-                import ast
-                try:
-                    response = ast.literal_eval(response)
-                except:
-                    pass
-        
-        if not isinstance(response, dict):
-            return "Completado"
-        
-        if tool_name == "get_vehicle_stats":
-            return "Estadísticas del vehículo obtenidas"
-        elif tool_name == "get_vehicle_info":
-            return "Información del vehículo obtenida"
-        elif tool_name == "get_driver_assignment":
-            data = response.get('data', [])
-            if not data:
-                return "Sin conductor asignado"
-            return "Conductor identificado"
-        elif tool_name == "get_safety_events":
-            total = response.get('total_events', 0)
-            return f"{total} eventos de seguridad"
-        elif tool_name == "get_camera_media":
-            ai_analysis = response.get('ai_analysis', {})
-            if ai_analysis and 'analyses' in ai_analysis:
-                count = len(ai_analysis['analyses'])
-                return f"{count} imágenes analizadas"
-            data = response.get('data', [])
-            return f"{len(data)} elementos de media"
-        
+    summarize = _TOOL_SUMMARIZERS.get(tool_name)
+    if summarize is None:
         return "Completado"
-    except Exception:
+    response = _parse_tool_response(response)
+    if not isinstance(response, dict):
         return "Completado"
+    return summarize(response)
 
 
 def _extract_media_urls(response: Any) -> List[str]:
     """Extrae URLs de media (samsara_url) de la respuesta de get_camera_media."""
     try:
-        if isinstance(response, str):
-            try:
-                response = json.loads(response)
-            except:
-                import ast
-                try:
-                    response = ast.literal_eval(response)
-                except:
-                    return []
-        
+        response = _parse_tool_response(response)
         if not isinstance(response, dict):
             return []
         
@@ -116,30 +144,119 @@ def _extract_media_urls(response: Any) -> List[str]:
         return []
 
 
+def _event_has_payload(event: Any) -> bool:
+    """Indica si un evento del runner trae contenido o tools que procesar."""
+    return bool(
+        getattr(event, 'content', None)
+        or getattr(event, 'tool_requests', None)
+        or getattr(event, 'tool_calls', None)
+        or getattr(event, 'tool_responses', None)
+    )
+
+
+def _prompt_json(data: Any) -> str:
+    """
+    Serializa datos para los mensajes de los agentes. Sin indentación: el LLM no
+    la necesita y json.dumps solo usa el encoder en C cuando indent es None.
+    """
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _first_entity_ref(candidates: Iterable[Any]) -> Dict[str, Any]:
+    """
+    Devuelve {"id", "name"} del primer candidato (en orden de prioridad) que
+    sea un dict con id; los candidatos se evalúan de forma perezosa.
+    """
+    for candidate in candidates:
+        if isinstance(candidate, dict) and candidate.get("id"):
+            return {"id": candidate["id"], "name": candidate.get("name")}
+    return {"id": None, "name": None}
+
+
+def _vehicle_candidates(
+    payload: Dict[str, Any], safety_event_detail: Dict[str, Any]
+) -> Iterator[Any]:
+    """
+    Ubicaciones del vehículo según la estructura del evento de Samsara:
+    - Nivel superior: payload.vehicle
+    - Dentro de data: data.vehicle
+    - AlertIncident: data.conditions[].details[].vehicle
+    - Safety events: preloaded_data.vehicle_info / safety_event_detail.vehicle
+    - IDs directos: vehicleId / vehicleName
+    """
+    data = payload.get("data", {})
+    yield payload.get("vehicle")
+    yield data.get("vehicle")
+    conditions = data.get("conditions", [])
+    if isinstance(conditions, list):
+        for condition in conditions:
+            details = condition.get("details", [])
+            if isinstance(details, list):
+                for detail in details:
+                    if isinstance(detail, dict):
+                        yield detail.get("vehicle")
+    yield payload.get("preloaded_data", {}).get("vehicle_info")
+    if safety_event_detail:
+        yield safety_event_detail.get("vehicle")
+    yield {"id": payload.get("vehicleId"), "name": payload.get("vehicleName")}
+
+
+def _driver_candidates(
+    payload: Dict[str, Any], safety_event_detail: Dict[str, Any]
+) -> Iterator[Any]:
+    """
+    Ubicaciones del conductor, por prioridad:
+    1. safety_event_detail.driver (conductor del momento del evento)
+    2. preloaded_data.driver_assignment.driver
+    3. payload.driver / data.driver
+    4. IDs directos: driverId / driverName
+    """
+    if safety_event_detail:
+        yield safety_event_detail.get("driver")
+    yield payload.get("preloaded_data", {}).get("driver_assignment", {}).get("driver")
+    yield payload.get("driver")
+    yield payload.get("data", {}).get("driver")
+    yield {"id": payload.get("driverId"), "name": payload.get("driverName")}
+
+
 def _clean_markdown(text: str) -> str:
     """Limpia bloques de código markdown del texto."""
     if not text:
         return text
+
+    # Sin fences no hay nada que limpiar (caso común en agentes de texto)
+    if '```' not in text:
+        return text.strip()
     
     # Remover bloques de código markdown (```json ... ``` o ``` ... ```)
     # Patrón para capturar el contenido entre los bloques
-    pattern = r'```(?:json|JSON)?\s*\n?(.*?)\n?```'
-    match = re.search(pattern, text, re.DOTALL)
+    match = _CODE_BLOCK_RE.search(text)
     if match:
         # Si encontramos un bloque de código, usar solo el contenido
         text = match.group(1).strip()
     else:
         # Si no hay bloques, intentar limpiar cualquier ``` residual
-        text = re.sub(r'^```\w*\s*', '', text, flags=re.MULTILINE)
-        text = re.sub(r'\s*```$', '', text, flags=re.MULTILINE)
+        text = _LEADING_FENCE_RE.sub('', text)
+        text = _TRAILING_FENCE_RE.sub('', text)
         text = text.strip()
     
     return text
 
 
+def _truncate(text: str, limit: int = 150) -> str:
+    """Recorta el texto para mostrarlo; si ya es corto se devuelve sin copiar."""
+    if len(text) <= limit:
+        return text
+    return text[:limit] + "..."
+
+
 def _generate_agent_summary(agent_name: str, raw_output: str) -> str:
     """Genera un resumen conciso basado en el output del agente."""
     clean_text = _clean_markdown(raw_output)
+
+    # final_agent y agentes desconocidos devuelven texto: se truncan sin parsear
+    if agent_name not in _JSON_OUTPUT_AGENTS:
+        return _truncate(clean_text)
     
     try:
         data = json.loads(clean_text)
@@ -159,10 +276,6 @@ def _generate_agent_summary(agent_name: str, raw_output: str) -> str:
             risk = data.get("risk_escalation", "monitor")
             return f"Evaluación: {verdict} ({confidence_pct}% confianza, {risk})"
         
-        # Final agent - returns string, not JSON
-        elif agent_name == "final_agent":
-            return clean_text[:150] + "..." if len(clean_text) > 150 else clean_text
-        
         # Notification decision agent
         elif agent_name == "notification_decision_agent":
             should_notify = data.get("should_notify", False)
@@ -176,7 +289,7 @@ def _generate_agent_summary(agent_name: str, raw_output: str) -> str:
         pass
     
     # Fallback: truncar
-    return clean_text[:150] + "..." if len(clean_text) > 150 else clean_text
+    return _truncate(clean_text)
 
 
 # ============================================================================
@@ -203,7 +316,7 @@ class PipelineExecutor:
         self._agent_results: List[AgentResult] = []
         self._current_agent: Optional[str] = None
         self._current_agent_result: Optional[AgentResult] = None
-        self._agent_start_time: Optional[datetime] = None
+        self._agent_start_ns: Optional[int] = None  # reloj monotónico, solo para duraciones
         self._agent_outputs: Dict[str, str] = {}
         self._pending_tools: Dict[str, Dict] = {}
         self._total_tools = 0
@@ -289,8 +402,6 @@ class PipelineExecutor:
         # =========================================================
         # CONSTRUIR MENSAJE INICIAL
         # =========================================================
-        import asyncio
-        
         if skip_triage:
             # Para revalidaciones: construir input directo para investigator
             initial_message = self._build_revalidation_message(payload, context)
@@ -301,10 +412,12 @@ class PipelineExecutor:
         # =========================================================
         # ANALIZAR IMÁGENES EN PARALELO
         # =========================================================
-        camera_analysis_task = asyncio.create_task(analyze_preloaded_media(payload))
-        
-        # Guardar referencia para obtener resultado después
-        self._camera_analysis_task = camera_analysis_task
+        # Solo si hay media pre-cargada: sin items no hay nada que analizar
+        # y se evita crear (y luego esperar) una tarea vacía
+        self._camera_analysis_task = (
+            asyncio.create_task(analyze_preloaded_media(payload))
+            if has_preloaded_media(payload) else None
+        )
         self._camera_analysis = None
         current_input = initial_message.parts[0].text
         
@@ -336,6 +449,8 @@ class PipelineExecutor:
             
             # Ejecutar pipeline (usa selected_runner según sea revalidación o no)
             event_count = 0
+            # Los logs DEBUG del loop arman strings/dicts por evento: solo si están activos
+            debug_enabled = logger.isEnabledFor(logging.DEBUG)
             async for event in selected_runner.run_async(
                 user_id=ServiceConfig.DEFAULT_USER_ID,
                 session_id=session_id,
@@ -346,9 +461,15 @@ class PipelineExecutor:
                 # Procesar cambio de agente
                 agent_name = self._detect_agent(event)
                 if agent_name:
-                    logger.debug(f"Agent detected: {agent_name} (event #{event_count})")
+                    if debug_enabled:
+                        logger.debug(f"Agent detected: {agent_name} (event #{event_count})")
                     current_input = await self._handle_agent_change(agent_name, session_id, current_input)
                 
+                # Eventos sin contenido ni tools (p.ej. solo cambios de estado):
+                # no hay texto ni tools que procesar
+                if not _event_has_payload(event):
+                    continue
+                
                 # Procesar tool calls/responses (fallback)
                 tracker = current_tool_tracker.get()
                 if not tracker:
@@ -357,24 +478,25 @@ class PipelineExecutor:
                 # Capturar texto generado
                 text = self._extract_text(event)
                 if text:
-                    logger.debug(f"Text extracted from {self._current_agent} (event #{event_count})", extra={
-                        "context": {
-                            "text_length": len(text),
-                            "text_preview": text[:200] if len(text) > 200 else text,
-                        }
-                    })
+                    if debug_enabled:
+                        logger.debug(f"Text extracted from {self._current_agent} (event #{event_count})", extra={
+                            "context": {
+                                "text_length": len(text),
+                                "text_preview": text[:200] if len(text) > 200 else text,
+                            }
+                        })
                     self._agent_outputs[self._current_agent] = text
                     self._update_span_output(text)
                     
                     # Parsear según el agente actual
                     if self._current_agent == "triage_agent":
-                        parsed = self._try_parse_json(text, ["alert_type", "alert_kind"])
+                        parsed = self._try_parse_json(text, _TRIAGE_KEYS)
                         if parsed:
                             alert_context = parsed
                             logger.info(f"Triage parsed successfully: alert_type={parsed.get('alert_type')}")
                     
                     elif self._current_agent == "investigator_agent":
-                        parsed = self._try_parse_json(text, ["likelihood", "verdict"])
+                        parsed = self._try_parse_json(text, _ASSESSMENT_KEYS)
                         if parsed:
                             assessment = parsed
                             logger.info(f"Assessment parsed successfully: verdict={parsed.get('verdict')}, risk_escalation={parsed.get('risk_escalation')}")
@@ -389,10 +511,11 @@ class PipelineExecutor:
                     elif self._current_agent == "final_agent":
                         # human_message es STRING, no JSON
                         human_message = text.strip()
-                        logger.debug(f"Human message captured: {len(human_message)} chars")
+                        if debug_enabled:
+                            logger.debug(f"Human message captured: {len(human_message)} chars")
                     
                     elif self._current_agent == "notification_decision_agent":
-                        parsed = self._try_parse_json(text, ["should_notify"])
+                        parsed = self._try_parse_json(text, _NOTIFICATION_DECISION_KEYS)
                         if parsed:
                             notification_decision = parsed
                             logger.info(f"Notification decision parsed: should_notify={parsed.get('should_notify')}")
@@ -411,14 +534,6 @@ class PipelineExecutor:
             # Finalizar último agente
             self._finalize_current_agent()
             
-            # Asegurar que el análisis de imágenes esté completo
-            if hasattr(self, '_camera_analysis_task') and self._camera_analysis_task:
-                try:
-                    self._camera_analysis = await self._camera_analysis_task
-                    self._camera_analysis_task = None
-                except Exception as e:
-                    logger.error(f"Error completing camera analysis: {e}")
-            
             # =========================================================
             # VALIDACIÓN CRÍTICA: Verificar que tenemos un assessment válido
             # Si el pipeline no generó un assessment, es un error
@@ -432,7 +547,9 @@ class PipelineExecutor:
                         "is_revalidation": is_revalidation,
                     }
                 })
-                # Cerrar spans antes de retornar error
+                # Cerrar spans antes de retornar error (el análisis de imágenes
+                # no se devuelve en este caso, no hace falta esperarlo)
+                self._cancel_camera_analysis()
                 self._close_all_spans()
                 return PipelineResult(
                     success=False,
@@ -440,8 +557,7 @@ class PipelineExecutor:
                 )
             
             # Validar que el assessment tenga los campos requeridos
-            required_fields = ["verdict", "likelihood", "confidence", "risk_escalation"]
-            missing_fields = [f for f in required_fields if f not in assessment]
+            missing_fields = [f for f in _ASSESSMENT_REQUIRED_FIELDS if f not in assessment]
             if missing_fields:
                 logger.error(f"Assessment is missing required fields (event_id={event_id})", extra={
                     "context": {
@@ -450,7 +566,9 @@ class PipelineExecutor:
                         "is_revalidation": is_revalidation,
                     }
                 })
-                # Cerrar spans antes de retornar error
+                # Cerrar spans antes de retornar error (el análisis de imágenes
+                # no se devuelve en este caso, no hace falta esperarlo)
+                self._cancel_camera_analysis()
                 self._close_all_spans()
                 return PipelineResult(
                     success=False,
@@ -474,8 +592,12 @@ class PipelineExecutor:
             # Cerrar spans
             self._close_all_spans()
             
-            # Actualizar trace
-            self._finalize_trace(assessment, human_message)
+            # Completar el análisis de imágenes (si sigue pendiente) y actualizar
+            # el trace en paralelo: no dependen entre sí
+            await asyncio.gather(
+                self._await_camera_analysis(),
+                self._finalize_trace(assessment, human_message),
+            )
             
             logger.info(f"Pipeline completed successfully (event_id={event_id})", extra={
                 "context": {
@@ -500,7 +622,7 @@ class PipelineExecutor:
             )
             
         except Exception as e:
-            self._handle_error(e)
+            await self._handle_error(e)
             return PipelineResult(
                 success=False,
                 error=str(e)
@@ -565,10 +687,7 @@ class PipelineExecutor:
         if not self._trace or agent_name in self._active_spans:
             return
         
-        available_tools = []
-        agent_def = AGENTS_BY_NAME.get(agent_name)
-        if agent_def and hasattr(agent_def, 'tools') and agent_def.tools:
-            available_tools = [t.__name__ for t in agent_def.tools]
+        available_tools = AGENT_TOOL_NAMES.get(agent_name, [])
         
         span = self._trace.span(
             name=f"agent_{agent_name}",
@@ -593,7 +712,7 @@ class PipelineExecutor:
         if self._pipeline_span:
             self._pipeline_span.end()
     
-    def _finalize_trace(self, assessment: Optional[Dict], human_message: Optional[str]):
+    async def _finalize_trace(self, assessment: Optional[Dict], human_message: Optional[str]):
         """Finaliza el trace de Langfuse."""
         if not self._trace:
             return
@@ -606,11 +725,9 @@ class PipelineExecutor:
             }
         )
         
-        # Flush to ensure traces are sent
-        if langfuse_client:
-            langfuse_client.flush()
+        await self._flush_langfuse()
     
-    def _handle_error(self, error: Exception):
+    async def _handle_error(self, error: Exception):
         """Maneja errores y actualiza el trace."""
         if self._trace:
             self._trace.update(
@@ -618,9 +735,16 @@ class PipelineExecutor:
                 status_message=str(error)
             )
         
-        # Flush to ensure error traces are sent
-        if langfuse_client:
-            langfuse_client.flush()
+        await self._flush_langfuse()
+    
+    async def _flush_langfuse(self):
+        """
+        El SDK envía los eventos en segundo plano (hilo propio) y main.py hace
+        flush al apagar; aquí solo se fuerza si LANGFUSE_FLUSH_PER_REQUEST está
+        activo, y fuera del event loop porque flush() bloquea hasta el POST.
+        """
+        if langfuse_client and LangfuseConfig.FLUSH_PER_REQUEST:
+            await asyncio.to_thread(langfuse_client.flush)
     
     # =========================================================================
     # PRIVATE: Message Building
@@ -642,7 +766,7 @@ class PipelineExecutor:
         """
         # Construir payload MÍNIMO para el triage (solo datos de clasificación)
         minimal_payload = self._build_triage_payload(payload, is_revalidation, context)
-        minimal_json = json.dumps(minimal_payload, ensure_ascii=False, indent=2)
+        minimal_json = _prompt_json(minimal_payload)
         
         if is_revalidation and context:
             text = f"Clasifica esta revalidación de alerta de Samsara:\n\nPAYLOAD:\n{minimal_json}"
@@ -672,15 +796,22 @@ class PipelineExecutor:
         data = payload.get("data", {})
         preloaded = payload.get("preloaded_data", {})
         
+        safety_event_detail = payload.get("safety_event_detail") or preloaded.get("safety_event_detail", {})
+        
+        # Campos del safety_event_detail usados en varios lugares (se leen una vez)
+        detail = safety_event_detail or {}
+        detail_label = detail.get("behavior_label")
+        detail_name = detail.get("behavior_name")
+        detail_severity = detail.get("severity")
+        
         # =====================================================================
         # EXTRACCIÓN DE VEHÍCULO (buscar en múltiples lugares)
         # =====================================================================
-        vehicle = self._extract_vehicle_info(payload)
+        vehicle = self._extract_vehicle_info(payload, safety_event_detail)
         
         # =====================================================================
         # EXTRACCIÓN DE CONDUCTOR (buscar en múltiples lugares)
         # =====================================================================
-        safety_event_detail = payload.get("safety_event_detail") or preloaded.get("safety_event_detail", {})
         driver = self._extract_driver_info(payload, safety_event_detail)
         
         # =====================================================================
@@ -692,17 +823,17 @@ class PipelineExecutor:
         # Behavior label es CRUCIAL para clasificar safety events
         behavior_label = (
             payload.get("behavior_label") 
-            or (safety_event_detail.get("behavior_label") if safety_event_detail else None)
-            or (safety_event_detail.get("behaviorLabel") if safety_event_detail else None)
+            or detail_label
+            or detail.get("behaviorLabel")
         )
         
         # También extraer behavior_name si existe
-        behavior_name = safety_event_detail.get("behavior_name") if safety_event_detail else None
+        behavior_name = detail_name
         
         # =====================================================================
         # EXTRAER DESCRIPCIÓN DEL EVENTO
         # =====================================================================
-        event_description = self._extract_event_description(payload)
+        event_description = self._extract_event_description(payload, safety_event_detail)
         
         # =====================================================================
         # CONSTRUIR PAYLOAD PARA TRIAGE
@@ -723,7 +854,7 @@ class PipelineExecutor:
             "happenedAtTime": (
                 payload.get("happenedAtTime") 
                 or data.get("happenedAtTime")
-                or (safety_event_detail.get("time") if safety_event_detail else None)
+                or detail.get("time")
             ),
             
             # Severity
@@ -734,7 +865,7 @@ class PipelineExecutor:
             "behavior_name": behavior_name,
             "samsara_severity": (
                 payload.get("samsara_severity") 
-                or (safety_event_detail.get("severity") if safety_event_detail else None)
+                or detail_severity
             ),
             
             # Notification contacts (solo nombres y roles, sin datos sensibles)
@@ -749,9 +880,9 @@ class PipelineExecutor:
         # Si tenemos safety_event_detail, incluir resumen relevante
         if safety_event_detail:
             minimal_payload["safety_event_summary"] = {
-                "behavior_label": safety_event_detail.get("behavior_label"),
-                "behavior_name": safety_event_detail.get("behavior_name"),
-                "severity": safety_event_detail.get("severity"),
+                "behavior_label": detail_label,
+                "behavior_name": detail_name,
+                "severity": detail_severity,
                 "max_acceleration_g": safety_event_detail.get("maxAccelerationGForce"),
                 "has_video": bool(safety_event_detail.get("downloadForwardVideoUrl") or safety_event_detail.get("downloadInwardVideoUrl")),
             }
@@ -760,8 +891,9 @@ class PipelineExecutor:
         if is_revalidation and context:
             minimal_payload["is_revalidation"] = True
             minimal_payload["investigation_count"] = context.get("investigation_count", 0)
-            minimal_payload["previous_verdict"] = context.get("previous_assessment", {}).get("verdict")
-            minimal_payload["previous_risk_escalation"] = context.get("previous_assessment", {}).get("risk_escalation")
+            previous_assessment = context.get("previous_assessment", {})
+            minimal_payload["previous_verdict"] = previous_assessment.get("verdict")
+            minimal_payload["previous_risk_escalation"] = previous_assessment.get("risk_escalation")
             
             # Resumen de ventanas sin el historial completo
             windows_history = payload.get('revalidation_windows_history', [])
@@ -775,115 +907,39 @@ class PipelineExecutor:
             }
         
         # Log para debugging
-        logger.debug("Triage payload built", extra={"context": {
-            "has_vehicle_id": bool(vehicle.get("id")),
-            "has_driver_id": bool(driver.get("id")),
-            "event_type": event_type,
-            "alert_type": alert_type,
-            "behavior_label": behavior_label,
-            "behavior_name": behavior_name,
-        }})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Triage payload built", extra={"context": {
+                "has_vehicle_id": bool(vehicle.get("id")),
+                "has_driver_id": bool(driver.get("id")),
+                "event_type": event_type,
+                "alert_type": alert_type,
+                "behavior_label": behavior_label,
+                "behavior_name": behavior_name,
+            }})
         
         return minimal_payload
     
-    def _extract_vehicle_info(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+    def _extract_vehicle_info(
+        self, payload: Dict[str, Any], safety_event_detail: Dict[str, Any]
+    ) -> Dict[str, Any]:
         """
         Extrae información del vehículo buscando en múltiples lugares del payload.
         
-        Samsara tiene diferentes estructuras según el tipo de evento:
-        - Nivel superior: payload.vehicle
-        - AlertIncident: data.conditions[].details[].vehicle
-        - Safety events: preloaded_data.vehicle_info
+        Samsara tiene diferentes estructuras según el tipo de evento; el orden de
+        búsqueda está en _vehicle_candidates y se recorre una sola vez.
         """
-        data = payload.get("data", {})
-        preloaded = payload.get("preloaded_data", {})
-        
-        # 1. Nivel superior
-        if payload.get("vehicle") and isinstance(payload["vehicle"], dict):
-            v = payload["vehicle"]
-            if v.get("id"):
-                return {"id": v.get("id"), "name": v.get("name")}
-        
-        # 2. Dentro de data
-        if data.get("vehicle") and isinstance(data["vehicle"], dict):
-            v = data["vehicle"]
-            if v.get("id"):
-                return {"id": v.get("id"), "name": v.get("name")}
-        
-        # 3. Dentro de data.conditions (AlertIncident)
-        conditions = data.get("conditions", [])
-        if isinstance(conditions, list):
-            for condition in conditions:
-                details = condition.get("details", [])
-                if isinstance(details, list):
-                    for detail in details:
-                        if isinstance(detail, dict) and detail.get("vehicle"):
-                            v = detail["vehicle"]
-                            if v.get("id"):
-                                return {"id": v.get("id"), "name": v.get("name")}
-        
-        # 4. Desde preloaded_data.vehicle_info
-        vehicle_info = preloaded.get("vehicle_info", {})
-        if vehicle_info.get("id"):
-            return {"id": vehicle_info.get("id"), "name": vehicle_info.get("name")}
-        
-        # 5. Desde safety_event_detail.vehicle
-        safety_detail = payload.get("safety_event_detail") or preloaded.get("safety_event_detail", {})
-        if safety_detail.get("vehicle"):
-            v = safety_detail["vehicle"]
-            if v.get("id"):
-                return {"id": v.get("id"), "name": v.get("name")}
-        
-        # 6. IDs directos
-        if payload.get("vehicleId"):
-            return {"id": payload.get("vehicleId"), "name": payload.get("vehicleName")}
-        
-        return {"id": None, "name": None}
+        return _first_entity_ref(_vehicle_candidates(payload, safety_event_detail))
     
     def _extract_driver_info(self, payload: Dict[str, Any], safety_event_detail: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Extrae información del conductor buscando en múltiples lugares.
-        
-        Prioridad:
-        1. safety_event_detail.driver (conductor del momento del evento)
-        2. preloaded_data.driver_assignment.driver
-        3. payload.driver
+        Extrae información del conductor buscando en múltiples lugares
+        (prioridad definida en _driver_candidates).
         """
-        preloaded = payload.get("preloaded_data", {})
-        
-        # 1. Desde safety_event_detail (más preciso para el momento del evento)
-        if safety_event_detail and safety_event_detail.get("driver"):
-            d = safety_event_detail["driver"]
-            if d.get("id"):
-                return {"id": d.get("id"), "name": d.get("name")}
-        
-        # 2. Desde driver_assignment
-        assignment = preloaded.get("driver_assignment", {})
-        if assignment.get("driver"):
-            d = assignment["driver"]
-            if d.get("id"):
-                return {"id": d.get("id"), "name": d.get("name")}
-        
-        # 3. Nivel superior
-        if payload.get("driver") and isinstance(payload["driver"], dict):
-            d = payload["driver"]
-            if d.get("id"):
-                return {"id": d.get("id"), "name": d.get("name")}
-        
-        # 4. Dentro de data
-        data = payload.get("data", {})
-        if data.get("driver") and isinstance(data["driver"], dict):
-            d = data["driver"]
-            if d.get("id"):
-                return {"id": d.get("id"), "name": d.get("name")}
-        
-        # 5. IDs directos
-        if payload.get("driverId"):
-            return {"id": payload.get("driverId"), "name": payload.get("driverName")}
-        
-        return {"id": None, "name": None}
+        return _first_entity_ref(_driver_candidates(payload, safety_event_detail))
     
-    def _extract_event_description(self, payload: Dict[str, Any]) -> Optional[str]:
+    def _extract_event_description(
+        self, payload: Dict[str, Any], safety_event_detail: Dict[str, Any]
+    ) -> Optional[str]:
         """
         Extrae la descripción del evento buscando en múltiples lugares.
         """
@@ -899,15 +955,13 @@ class PipelineExecutor:
                 if condition.get("description"):
                     return condition["description"]
         
-        # 3. Desde safety_event_detail
-        preloaded = payload.get("preloaded_data", {})
-        safety_detail = payload.get("safety_event_detail") or preloaded.get("safety_event_detail", {})
-        if safety_detail:
+        # 3. Desde safety_event_detail (ya resuelto por _build_triage_payload)
+        if safety_event_detail:
             # Usar behavior_name como descripción si existe
-            if safety_detail.get("behavior_name"):
-                return safety_detail["behavior_name"]
-            if safety_detail.get("behavior_label"):
-                return safety_detail["behavior_label"]
+            if safety_event_detail.get("behavior_name"):
+                return safety_event_detail["behavior_name"]
+            if safety_event_detail.get("behavior_label"):
+                return safety_event_detail["behavior_label"]
         
         return None
     
@@ -959,7 +1013,7 @@ class PipelineExecutor:
         previous_alert_context = context.get("previous_alert_context", {})
         parts.append("## CONTEXTO DE ALERTA (del triaje original)")
         parts.append("```json")
-        parts.append(json.dumps(previous_alert_context, ensure_ascii=False, indent=2))
+        parts.append(_prompt_json(previous_alert_context))
         parts.append("```")
         
         # 2. Contexto temporal de revalidación
@@ -985,13 +1039,13 @@ class PipelineExecutor:
             # Excluir camera_media - se agrega con el análisis Vision
             filtered_preloaded = {k: v for k, v in preloaded.items() if k != 'camera_media'}
             parts.append("\n## DATOS PRE-CARGADOS (preloaded_data)")
-            parts.append(json.dumps(filtered_preloaded, ensure_ascii=False, indent=2))
+            parts.append(_prompt_json(filtered_preloaded))
         
         # 5. Safety event detail si existe
         safety_detail = payload.get('safety_event_detail')
         if safety_detail:
             parts.append("\n## DETALLE DEL SAFETY EVENT")
-            parts.append(json.dumps(safety_detail, ensure_ascii=False, indent=2))
+            parts.append(_prompt_json(safety_detail))
         
         # 6. Datos NUEVOS de revalidación (lo más importante)
         revalidation_data = payload.get('revalidation_data', {})
@@ -999,7 +1053,7 @@ class PipelineExecutor:
             parts.append("\n## ⭐ DATOS NUEVOS (revalidation_data) - PRIORIZA ESTOS")
             # Excluir camera_media - se agrega con el análisis Vision
             filtered_reval = {k: v for k, v in revalidation_data.items() if 'camera' not in k.lower()}
-            parts.append(json.dumps(filtered_reval, ensure_ascii=False, indent=2))
+            parts.append(_prompt_json(filtered_reval))
             
             # Resumen de lo nuevo
             new_safety = revalidation_data.get('safety_events_since_last_check', {}).get('total_events', 0)
@@ -1013,7 +1067,7 @@ class PipelineExecutor:
         if windows_history:
             total_minutes = sum(w.get('time_window', {}).get('minutes_covered', 0) for w in windows_history)
             parts.append(f"\n## HISTORIAL DE INVESTIGACIONES ({len(windows_history)} ventanas, {total_minutes} minutos observados)")
-            parts.append(json.dumps(windows_history, ensure_ascii=False, indent=2))
+            parts.append(_prompt_json(windows_history))
         
         # 8. Contact names for context (phone resolution is backend-only)
         contacts = payload.get('notification_contacts', {})
@@ -1021,7 +1075,7 @@ class PipelineExecutor:
             minimal = {k: {"name": v.get("name"), "role": v.get("role")} for k, v in contacts.items() if isinstance(v, dict)}
             if minimal:
                 parts.append("\n## CONTACTOS DISPONIBLES (solo nombres)")
-                parts.append(json.dumps(minimal, ensure_ascii=False, indent=2))
+                parts.append(_prompt_json(minimal))
         
         # 9. Instrucciones finales
         parts.append("\n## INSTRUCCIONES")
@@ -1101,7 +1155,7 @@ class PipelineExecutor:
             if escalation_matrix:
                 parts.append("## MATRIZ DE ESCALACIÓN (configuración de empresa)")
                 parts.append("Usa esta matriz personalizada en lugar de la matriz por defecto:")
-                parts.append(json.dumps(escalation_matrix, ensure_ascii=False, indent=2))
+                parts.append(_prompt_json(escalation_matrix))
                 parts.append("")
         
         # 1. Assessment (es lo principal para decidir notificaciones)
@@ -1131,7 +1185,7 @@ class PipelineExecutor:
                         }
                 if minimal:
                     parts.append("\n## DESTINATARIOS DISPONIBLES (solo tipos, sin numeros)")
-                    parts.append(json.dumps(minimal, ensure_ascii=False, indent=2))
+                    parts.append(_prompt_json(minimal))
         
         return "\n".join(parts)
     
@@ -1170,13 +1224,13 @@ class PipelineExecutor:
                 parts.append("\n## DATOS PRE-CARGADOS (preloaded_data)")
                 # No incluir camera_media aquí - se agrega con el análisis Vision
                 filtered_preloaded = {k: v for k, v in preloaded.items() if k != 'camera_media'}
-                parts.append(json.dumps(filtered_preloaded, ensure_ascii=False, indent=2))
+                parts.append(_prompt_json(filtered_preloaded))
             
             # Safety event detail si existe
             safety_detail = self._full_payload.get('safety_event_detail')
             if safety_detail:
                 parts.append("\n## DETALLE DEL SAFETY EVENT")
-                parts.append(json.dumps(safety_detail, ensure_ascii=False, indent=2))
+                parts.append(_prompt_json(safety_detail))
         
         # 3. Datos de revalidación si aplica
         if self._is_revalidation and self._full_payload:
@@ -1185,12 +1239,12 @@ class PipelineExecutor:
                 parts.append("\n## DATOS DE REVALIDACIÓN (revalidation_data)")
                 # No incluir camera_media - se agrega con el análisis Vision
                 filtered_reval = {k: v for k, v in revalidation_data.items() if 'camera' not in k.lower()}
-                parts.append(json.dumps(filtered_reval, ensure_ascii=False, indent=2))
+                parts.append(_prompt_json(filtered_reval))
             
             windows_history = self._full_payload.get('revalidation_windows_history', [])
             if windows_history:
                 parts.append("\n## HISTORIAL DE VENTANAS DE INVESTIGACIÓN")
-                parts.append(json.dumps(windows_history, ensure_ascii=False, indent=2))
+                parts.append(_prompt_json(windows_history))
             
             if self._revalidation_context:
                 parts.append("\n## CONTEXTO TEMPORAL")
@@ -1205,10 +1259,28 @@ class PipelineExecutor:
                 minimal = {k: {"name": v.get("name"), "role": v.get("role")} for k, v in contacts.items() if isinstance(v, dict)}
                 if minimal:
                     parts.append("\n## CONTACTOS DISPONIBLES (solo nombres)")
-                    parts.append(json.dumps(minimal, ensure_ascii=False, indent=2))
+                    parts.append(_prompt_json(minimal))
         
         return "\n".join(parts)
     
+    async def _await_camera_analysis(self):
+        """Espera el análisis de imágenes si no se consumió durante el pipeline."""
+        task = getattr(self, '_camera_analysis_task', None)
+        if not task:
+            return
+        try:
+            self._camera_analysis = await task
+            self._camera_analysis_task = None
+        except Exception as e:
+            logger.error(f"Error completing camera analysis: {e}")
+    
+    def _cancel_camera_analysis(self):
+        """Cancela el análisis de imágenes pendiente cuando su resultado no se usará."""
+        task = getattr(self, '_camera_analysis_task', None)
+        if task and not task.done():
+            task.cancel()
+        self._camera_analysis_task = None
+    
     async def _inject_camera_analysis_if_ready(self, current_input: str) -> str:
         """
         Inyecta el análisis de imágenes al input si está listo.
@@ -1227,7 +1299,7 @@ class PipelineExecutor:
                 logger.info(f"Camera analysis ready: {num_images} images analyzed")
                 
                 # Inyectar al input del investigator
-                analysis_json = json.dumps(self._camera_analysis, ensure_ascii=False, indent=2)
+                analysis_json = _prompt_json(self._camera_analysis)
                 camera_note = f"""
 
 ## ANÁLISIS DE IMÁGENES (Vision AI)
@@ -1306,10 +1378,10 @@ Se analizaron {num_images} imágenes con Vision AI:
         # Iniciar nuevo agente si no existe
         existing_names = [a.name for a in self._agent_results]
         if agent_name not in existing_names:
-            self._agent_start_time = datetime.utcnow()
+            self._agent_start_ns = time.monotonic_ns()
             self._current_agent_result = AgentResult(
                 name=agent_name,
-                started_at=self._agent_start_time.isoformat() + "Z"
+                started_at=datetime.utcnow().isoformat() + "Z"
             )
             self._agent_results.append(self._current_agent_result)
         
@@ -1334,8 +1406,8 @@ Se analizaron {num_images} imágenes con Vision AI:
         if self._current_agent_result.completed_at:
             return  # Ya finalizado
         
-        if self._agent_start_time:
-            duration = int((datetime.utcnow() - self._agent_start_time).total_seconds() * 1000)
+        if self._agent_start_ns is not None:
+            duration = (time.monotonic_ns() - self._agent_start_ns) // 1_000_000
             self._current_agent_result.duration_ms = duration
         
         self._current_agent_result.completed_at = datetime.utcnow().isoformat() + "Z"
@@ -1365,7 +1437,7 @@ Se analizaron {num_images} imágenes con Vision AI:
                 tool_name = tool_req.function.name
             
             self._pending_tools[tool_name] = {
-                "start_time": datetime.utcnow()
+                "start_ns": time.monotonic_ns()
             }
             self._total_tools += 1
         
@@ -1375,8 +1447,8 @@ Se analizaron {num_images} imágenes con Vision AI:
                 tool_name = getattr(tool_resp, 'name', 'unknown_tool')
                 
                 if tool_name in self._pending_tools:
-                    start_time = self._pending_tools[tool_name]["start_time"]
-                    duration = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+                    start_ns = self._pending_tools[tool_name]["start_ns"]
+                    duration = (time.monotonic_ns() - start_ns) // 1_000_000
                     
                     response = getattr(tool_resp, 'response', None)
                     summary = _generate_tool_summary(tool_name, response)
@@ -1415,7 +1487,7 @@ Se analizaron {num_images} imágenes con Vision AI:
         if self._current_agent and self._current_agent in self._active_spans:
             self._active_spans[self._current_agent].update(output=text)
     
-    def _try_parse_json(self, text: str, required_keys: List[str]) -> Optional[Dict[str, Any]]:
+    def _try_parse_json(self, text: str, required_keys: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
         """Intenta parsear el texto como JSON y verificar keys requeridas."""
         try:
             clean_text = _clean_markdown(text)
@@ -1427,20 +1499,21 @@ Se analizaron {num_images} imágenes con Vision AI:
             parsed = json.loads(clean_text)
             
             if isinstance(parsed, dict):
-                # Aplicar corrección de encoding DESPUÉS de parsear
-                # para limpiar valores de texto dentro del JSON
-                parsed = _fix_dict_encoding(parsed)
-                
                 # Verificar que tiene al menos una de las keys requeridas
-                for key in required_keys:
-                    if key in parsed:
+                key = next((k for k in required_keys if k in parsed), None)
+                if key is not None:
+                    # Aplicar corrección de encoding DESPUÉS de parsear para limpiar
+                    # valores de texto dentro del JSON (solo cambia valores, no keys,
+                    # así que se aplica únicamente al resultado que se va a usar)
+                    parsed = _fix_dict_encoding(parsed)
+                    if logger.isEnabledFor(logging.DEBUG):
                         logger.debug(f"Successfully parsed JSON with key '{key}'", extra={
                             "context": {
                                 "agent": self._current_agent,
                                 "parsed_keys": list(parsed.keys()),
                             }
                         })
-                        return parsed
+                    return parsed
                 
                 # Si tiene otras keys pero no las requeridas, loguear para debugging
                 logger.warning(f"Parsed JSON but missing required keys", extra={
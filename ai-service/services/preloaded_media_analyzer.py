@@ -14,7 +14,7 @@ Esto evita:
 import base64
 import json
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import httpx
 from litellm import acompletion
@@ -24,6 +24,33 @@ from config import OpenAIConfig
 logger = logging.getLogger(__name__)
 
 
+def _find_camera_items(payload: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Busca los items de camara pre-cargados y devuelve (items, origen).
+    
+    Prioridad: revalidation_data.camera_media_since_last_check (revalidaciones)
+    y luego preloaded_data.camera_media (procesamiento inicial).
+    """
+    revalidation = payload.get('revalidation_data', {})
+    if revalidation:
+        reval_camera = revalidation.get('camera_media_since_last_check', {})
+        if reval_camera and reval_camera.get('items'):
+            return reval_camera['items'], 'revalidation_data'
+    
+    preloaded = payload.get('preloaded_data', {})
+    if preloaded:
+        preload_camera = preloaded.get('camera_media', {})
+        if preload_camera and preload_camera.get('items'):
+            return preload_camera['items'], 'preloaded_data'
+    
+    return [], None
+
+
+def has_preloaded_media(payload: Dict[str, Any]) -> bool:
+    """Indica si el payload trae items de camara para analizar (chequeo barato, sin I/O)."""
+    return bool(_find_camera_items(payload)[0])
+
+
 async def analyze_preloaded_media(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
     Analiza las imagenes pre-cargadas desde Laravel con Vision AI.
@@ -38,30 +65,11 @@ async def analyze_preloaded_media(payload: Dict[str, Any]) -> Optional[Dict[str,
     Returns:
         Dict con analisis de las imagenes, o None si no hay imagenes
     """
-    # Extraer imagenes pre-cargadas
-    preloaded = payload.get('preloaded_data', {})
-    revalidation = payload.get('revalidation_data', {})
-    
-    # Buscar items de camara
-    camera_items = []
-    
-    # Primero buscar en revalidation_data (prioridad para revalidaciones)
-    if revalidation:
-        reval_camera = revalidation.get('camera_media_since_last_check', {})
-        if reval_camera and reval_camera.get('items'):
-            camera_items = reval_camera['items']
-            logger.info(f"Found {len(camera_items)} camera items in revalidation_data")
-    
-    # Si no hay en revalidation, buscar en preloaded_data
-    if not camera_items and preloaded:
-        preload_camera = preloaded.get('camera_media', {})
-        if preload_camera and preload_camera.get('items'):
-            camera_items = preload_camera['items']
-            logger.info(f"Found {len(camera_items)} camera items in preloaded_data")
-    
+    camera_items, source = _find_camera_items(payload)
     if not camera_items:
         logger.info("No camera items found in preloaded data")
         return None
+    logger.info(f"Found {len(camera_items)} camera items in {source}")
     
     # Filtrar solo imagenes (no videos)
     image_items = [
@@ -9,7 +9,7 @@ from unittest.mock import patch, AsyncMock, MagicMock
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
-from services.preloaded_media_analyzer import analyze_preloaded_media
+from services.preloaded_media_analyzer import analyze_preloaded_media, has_preloaded_media
 
 
 @pytest.mark.asyncio
@@ -76,6 +76,13 @@ async def test_returns_none_when_no_preloaded_data():
     assert result is None
 
 
+def test_has_preloaded_media():
+    assert has_preloaded_media({"preloaded_data": {"camera_media": {"items": [{"url": "x"}]}}})
+    assert has_preloaded_media({"revalidation_data": {"camera_media_since_last_check": {"items": [{"url": "x"}]}}})
+    assert not has_preloaded_media({"preloaded_data": {"camera_media": {"items": []}}})
+    assert not has_preloaded_media({})
+
+
 @pytest.mark.asyncio
 async def test_handles_revalidation_data():
     mock_http_response = MagicMock()
@@ -5,11 +5,21 @@ Tests for the PipelineExecutor service.
 import os
 import sys
 import pytest
+from types import SimpleNamespace
 from unittest.mock import patch, AsyncMock, MagicMock
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
-from services.pipeline_executor import PipelineExecutor
+from services.pipeline_executor import (
+    PipelineExecutor,
+    _driver_candidates,
+    _event_has_payload,
+    _extract_media_urls,
+    _first_entity_ref,
+    _generate_agent_summary,
+    _generate_tool_summary,
+    _vehicle_candidates,
+)
 
 
 @pytest.mark.asyncio
@@ -119,3 +129,47 @@ async def test_execute_revalidation_uses_different_runner(sample_alert_payload,
         )
 
     assert result is not None
+
+
+def test_tool_summary_helpers():
+    """Tool summaries parse dict responses and skip non-object strings."""
+    assert _generate_tool_summary("get_safety_events", '{"total_events": 3}') == "3 eventos de seguridad"
+    assert _generate_tool_summary("get_safety_events", "{'total_events': 2}") == "2 eventos de seguridad"
+    assert _generate_tool_summary("get_safety_events", "timeout") == "Completado"
+    assert _generate_tool_summary("get_safety_events", "{truncado") == "Completado"
+    assert _generate_tool_summary("get_camera_media", '{"data": null}') == "0 elementos de media"
+    assert _generate_tool_summary("unknown_tool", '{"total_events": 3}') == "Completado"
+    assert _extract_media_urls('{"data": [{"url": "https://x/1.jpg"}]}') == ["https://x/1.jpg"]
+    assert _extract_media_urls("[]") == []
+
+
+def test_agent_summary_helpers():
+    """JSON agents are summarized from their fields; text agents are truncated."""
+    triage = '```json\n{"alert_type": "panic", "alert_kind": "safety", "severity_level": "critical"}\n```'
+    assert _generate_agent_summary("triage_agent", triage) == "Triaje: panic (safety, critical)"
+    assert _generate_agent_summary("final_agent", "  Mensaje corto  ") == "Mensaje corto"
+    assert _generate_agent_summary("final_agent", "x" * 200) == "x" * 150 + "..."
+
+
+def test_entity_candidates_priority():
+    """Vehicle/driver lookups return the first location with an id, in priority order."""
+    payload = {
+        "vehicle": {"name": "sin id"},
+        "data": {"conditions": [{"details": [{"vehicle": {"id": "v-cond", "name": "T-1"}}]}]},
+        "preloaded_data": {
+            "vehicle_info": {"id": "v-pre"},
+            "driver_assignment": {"driver": {"id": "d-assign", "name": "Ana"}},
+        },
+        "driverId": "d-direct",
+    }
+    assert _first_entity_ref(_vehicle_candidates(payload, {})) == {"id": "v-cond", "name": "T-1"}
+    assert _first_entity_ref(_driver_candidates(payload, {})) == {"id": "d-assign", "name": "Ana"}
+    assert _first_entity_ref(_driver_candidates(payload, {"driver": {"id": "d-event"}})) == {"id": "d-event", "name": None}
+    assert _first_entity_ref(_vehicle_candidates({}, {})) == {"id": None, "name": None}
+
+
+def test_event_has_payload():
+    """Runner events without content or tools are skipped by the event loop."""
+    assert not _event_has_payload(SimpleNamespace(author="triage_agent", content=None))
+    assert _event_has_payload(SimpleNamespace(content=SimpleNamespace(parts=[])))
+    assert _event_has_payload(SimpleNamespace(content=None, tool_responses=[object()]))
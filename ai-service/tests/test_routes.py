@@ -127,3 +127,27 @@ async def test_traceparent_header_propagated(app_client):
 
     assert "traceparent" in response.headers
     assert "x-trace-id" in response.headers
+
+
+@pytest.mark.asyncio
+async def test_traceparent_trace_id_preserved(app_client):
+    traceparent = "00-abcdef1234567890abcdef1234567890-1234567890abcdef-01"
+
+    async with app_client as client:
+        response = await client.get("/health", headers={"traceparent": traceparent})
+
+    assert response.headers["x-trace-id"] == "abcdef1234567890abcdef1234567890"
+    assert response.headers["traceparent"].startswith("00-abcdef1234567890abcdef1234567890-")
+    assert response.headers["traceparent"].endswith("-01")
+
+
+def test_is_valid_traceparent():
+    from main import _is_valid_traceparent
+
+    assert _is_valid_traceparent("00-abcdef1234567890abcdef1234567890-1234567890abcdef-01")
+    assert not _is_valid_traceparent("01-abcdef1234567890abcdef1234567890-1234567890abcdef-01")
+    assert not _is_valid_traceparent("00-ABCDEF1234567890ABCDEF1234567890-1234567890abcdef-01")
+    assert not _is_valid_traceparent("00-abcdef1234567890abcdef1234567890_1234567890abcdef-01")
+    assert not _is_valid_traceparent("00-abcdef1234567890abcdef123456789z-1234567890abcdef-01")
+    assert not _is_valid_traceparent("00-abcdef1234567890abcdef1234567890-1234567890abcdef-01-")
+    assert not _is_valid_traceparent("")